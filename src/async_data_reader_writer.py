@@ -0,0 +1,157 @@
+import asyncio
+import functools
+import inspect
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, Iterable, List, Union
+from data_reader_writer import DataReaderWriter
+from metrics import Metrics
+from unitfier import Unitfier
+
+
+# Makes an async variant of a method of DataReaderWriter, run in the I/O executor. database is the position of the database argument of
+# the method (None for methods that do not use SQLite), whose calls are serialized per database (see AsyncDataReaderWriter._run_io).
+def _io_method(name: str, database: int = None) -> Callable:
+    parameter = None if database is None else list(inspect.signature(getattr(DataReaderWriter, name)).parameters)[database + 1]
+
+    async def method(self, *args, **kwargs):
+        database_name = None
+        if database is not None:
+            database_name = kwargs[parameter] if parameter in kwargs else args[database]
+        return await self._run_io(functools.partial(getattr(self.reader_writer, name), *args, **kwargs), database_name)
+
+    method.__name__ = name
+    method.__qualname__ = "AsyncDataReaderWriter." + name
+    return method
+
+
+# The default conversions of AsyncDataReaderWriter.pipeline, as functions of the module so they can be sent to a process executor. A key with
+# the separator more than ones raises a ValueError (see Unitfier.iter_file_format_to_code_format).
+def _to_code_format(unitfier: Unitfier, data: List[dict]) -> List[dict]:
+    return list(unitfier.iter_file_format_to_code_format(data))
+
+
+def _to_file_format(unitfier: Unitfier, uom_in_key: bool, uom_abbreviated: bool, data: List[dict]) -> List[dict]:
+    return list(unitfier.iter_code_format_to_file_format(unitfier.iter_file_format_to_code_format(data), uom_in_key, uom_abbreviated))
+
+
+class AsyncDataReaderWriter:
+
+    # The constructor takes the same inputs as DataReaderWriter, the maximum number of threads that read and write files and databases at the
+    # same time, and the executor to run unit conversions in (one thread by default, so the Unitfier converts one source at a time while the
+    # event loop and the I/O threads go on). A ProcessPoolExecutor runs CPU-heavy conversions outside the GIL; the Unitfier (see
+    # Unitfier.__getstate__), the conversion function and its data are then pickled. SQLite connections are shared by the I/O threads, and the calls on one database are run one at a time.
+    def __init__(self, sqlite_pragmas: dict = None, unitfier: Unitfier = None, metrics: Metrics = None, max_io_workers: int = 4,
+                 conversion_executor: Executor = None):
+        self.reader_writer = DataReaderWriter(sqlite_pragmas, unitfier, metrics, sqlite_check_same_thread=False)
+        self.unitfier = self.reader_writer.unitfier
+        self._io_executor = ThreadPoolExecutor(max_workers=max_io_workers, thread_name_prefix="io")
+        self._conversion_executor = conversion_executor if conversion_executor is not None else ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversion")
+        self._database_locks = {}
+
+    # Closes the database connections and shuts the executors down
+    def close(self):
+        self._io_executor.shutdown()
+        self._conversion_executor.shutdown()
+        self.reader_writer.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    # Runs a function in the I/O executor. With a database, the function holds the lock of the database while it runs, as an SQLite connection
+    # can not be used by two threads at the same time.
+    async def _run_io(self, function: Callable, database: str = None):
+        if database is not None:
+            lock = self._database_locks.setdefault(database, threading.Lock())
+            function = functools.partial(self._run_locked, lock, function)
+        return await asyncio.get_running_loop().run_in_executor(self._io_executor, function)
+
+    @staticmethod
+    def _run_locked(lock: threading.Lock, function: Callable):
+        with lock:
+            return function()
+
+    # A method that runs a function (e.g. a conversion method of the Unitfier) with the arguments in the conversion executor, so it does not
+    # block the event loop. The method outputs the result of the function.
+    async def convert(self, function: Callable, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._conversion_executor, functools.partial(function, *args, **kwargs))
+
+    ### FUNCTIONS TO READ DATA INTO DICTIONARIES (see DataReaderWriter) ###
+    read_csv = _io_method("read_csv")
+    read_json = _io_method("read_json")
+    read_jsonl = _io_method("read_jsonl")
+    read_xml = _io_method("read_xml")
+    read_database_table = _io_method("read_database_table", database=0)
+    query_database_table = _io_method("query_database_table", database=0)
+    read_npy_dataset = _io_method("read_npy_dataset")
+
+    ### FUNCTIONS TO CREATE DATA FILES/TABLE FROM DICTIONARIES (see DataReaderWriter) ###
+    create_csv = _io_method("create_csv")
+    create_json = _io_method("create_json")
+    create_jsonl = _io_method("create_jsonl")
+    create_xml = _io_method("create_xml")
+    create_npy_dataset = _io_method("create_npy_dataset")
+    create_database_table = _io_method("create_database_table", database=1)
+
+    # A method that reads a source (see DataReaderWriter.iter_source) into a list of dictionaries in file format.
+    async def read(self, source: Union[str, tuple]) -> List[dict]:
+        kind, location = DataReaderWriter.resolve_location(source)
+        database = location[0] if kind == "database" else None
+        return await self._run_io(lambda: list(self.reader_writer.iter_source(source)), database)
+
+    # A method that writes dictionaries in file format to a target (see DataReaderWriter.write_target), in the mode (with the key) of the
+    # create_* writers.
+    async def create(self, data: Iterable[dict], target: Union[str, tuple], mode: str = "create", key: Union[str, List[str]] = None):
+        kind, location = DataReaderWriter.resolve_location(target)
+        database = location[0] if kind == "database" else None
+        await self._run_io(lambda: self.reader_writer.write_target(data, target, mode, key), database)
+
+    # A method that reads, converts and writes many sources as a pipeline: while source N is converted (in the conversion executor), source N+1
+    # is read and the result of source N-1 is written (in the I/O executor). The method takes the sources (see read), the targets to write the
+    # results to (see create, one per source) and the conversion, a function from the data of a source to the result. By default the data
+    # is made into code format, or, with targets, into file format with the quantities in base units (uom_in_key and uom_abbreviated as in
+    # Unitfier.make_code_format_to_file_format). The method outputs the results of the sources in order (the targets, with targets).
+    async def pipeline(self, sources: List, targets: List[str] = None, convert: Callable = None, uom_in_key: bool = False,
+                       uom_abbreviated: bool = False) -> List:
+        if targets is not None and len(targets) != len(sources):
+            raise ValueError("The pipeline needs one target per source.")
+        if convert is None:
+            if targets is None:
+                convert = functools.partial(_to_code_format, self.unitfier)
+            else:
+                convert = functools.partial(_to_file_format, self.unitfier, uom_in_key, uom_abbreviated)
+
+        results = [None] * len(sources)
+        read_queue = asyncio.Queue(maxsize=1)
+        write_queue = asyncio.Queue(maxsize=1)
+
+        async def read_stage():
+            for i, source in enumerate(sources):
+                await read_queue.put((i, await self.read(source)))
+            await read_queue.put(None)
+
+        async def convert_stage():
+            while (item := await read_queue.get()) is not None:
+                i, data = item
+                results[i] = await self.convert(convert, data)
+                if targets is not None:
+                    await write_queue.put(i)
+            await write_queue.put(None)
+
+        async def write_stage():
+            while (i := await write_queue.get()) is not None:
+                await self.create(results[i], targets[i])
+                results[i] = targets[i]
+
+        # A failing stage cancels the others, which would otherwise wait on the queues
+        tasks = [asyncio.ensure_future(stage()) for stage in (read_stage, convert_stage, write_stage)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return results
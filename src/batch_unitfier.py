@@ -0,0 +1,218 @@
+import glob
+import io
+import json
+import os
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Union
+from unitfier import Unitfier
+from data_reader_writer import DataReaderWriter
+
+# Unitfiers (and DataReaderWriters) of a worker process, one per Unitfier configuration
+_worker_readers = {}
+
+
+# A function that outputs the Unitfier configuration that is sent to the worker processes (the separators/suffix and the registry cache folder)
+def _unitfier_config(unitfier: Unitfier) -> tuple:
+    return (unitfier.uom_suffix, unitfier.uom_separator_start, unitfier.uom_separator_end, unitfier._unit_registry_cache_folder)
+
+
+# A function that outputs the DataReaderWriter of the worker process for a Unitfier configuration, made the first time it is needed
+def _get_worker_reader(config: tuple) -> DataReaderWriter:
+    if config not in _worker_readers:
+        suffix, separator_start, separator_end, cache_folder = config
+        u = Unitfier(suffix, separator_start, separator_end, unit_registry_cache_folder=cache_folder)
+        _worker_readers[config] = DataReaderWriter(unitfier=u)
+    return _worker_readers[config]
+
+
+# A function, run in a worker process, that reads a source and makes it into blocks of plain values (magnitudes in base units and unit
+# strings, see Unitfier.make_file_format_to_base_value_blocks), which are sent back to the main process instead of pickled Pint quantities
+def _unitfy_source(task: tuple) -> List[tuple]:
+    source, config = task
+    drw = _get_worker_reader(config)
+    return drw.unitfier.make_file_format_to_base_value_blocks(drw.iter_source(source))
+
+
+# A function that outputs the byte ranges (start, end) of the shards of a csv or jsonl file, each about shard_size bytes and ending at the end
+# of a line, and the header line of a csv file (b"" for jsonl). Records are assumed to be one line each (no quoted line breaks in csv fields).
+def _shard_ranges(filename: str, shard_size: int) -> tuple:
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in (".csv", ".jsonl"):
+        raise ValueError(f"File '{filename}' is not a csv or jsonl file, which can be sharded.")
+
+    size = os.path.getsize(filename)
+    ranges = []
+    with open(filename, "rb") as f:
+        header = b"" if extension == ".jsonl" else f.readline()
+        start = f.tell()
+        while start < size:
+            f.seek(min(start + max(shard_size, 1), size))
+            f.readline()
+            end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return header, ranges
+
+
+# A function that reads the bytes from start to end of a file
+def _read_range(filename: str, start: int, end: int) -> bytes:
+    with open(filename, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+# A function that outputs the dtypes to read every shard of a csv file with, inferred once from the first shard, so a column does not get
+# another type in each shard (e.g. an integer column with blanks in some shards only). Integer columns are read as nullable integers, so
+# blanks are read as None, and text columns as str. Columns that are empty in the first shard are left to pandas in each shard. A value of a
+# later shard that does not fit the type of its column raises a ValueError.
+def _shard_dtypes(filename: str, header: bytes, ranges: List[tuple]) -> dict:
+    if not header or not ranges:
+        return None
+
+    import pandas as pd
+    df = pd.read_csv(io.BytesIO(header + _read_range(filename, *ranges[0])))
+    dtypes = {}
+    for col, dtype in df.dtypes.items():
+        if df[col].isna().all():
+            continue
+        dtypes[col] = "Int64" if dtype.kind in "iu" else "boolean" if dtype.kind == "b" else str if dtype.kind == "O" else dtype
+    return dtypes
+
+
+# A function that reads the dictionaries of one shard (a byte range) of a csv or jsonl file, reading only that range. The columns of a csv
+# shard are read with dtypes (see _shard_dtypes).
+def _read_shard(drw: DataReaderWriter, filename: str, start: int, end: int, header: bytes, dtypes: dict) -> List[dict]:
+    chunk = _read_range(filename, start, end)
+    if not header:
+        return [json.loads(line) for line in chunk.splitlines() if line.strip()]
+
+    import pandas as pd
+    return drw._dataframe_to_dicts(pd.read_csv(io.BytesIO(header + chunk), dtype=dtypes))
+
+
+# A function, run in a worker process, that reads and unitfies one shard of a file. Depending on output, the shard is sent back as blocks of
+# plain values (None), as dictionaries in file format (("rows", uom_in_key, uom_abbreviated)) or written to a file of its own
+# (("file", target, uom_in_key, uom_abbreviated)), in which case the target is sent back.
+def _unitfy_shard(task: tuple):
+    filename, start, end, header, dtypes, config, output = task
+    drw = _get_worker_reader(config)
+    data = _read_shard(drw, filename, start, end, header, dtypes)
+
+    if output is None:
+        return drw.unitfier.make_file_format_to_base_value_blocks(data)
+
+    # A key with the separator more than ones raises a ValueError (see Unitfier.iter_file_format_to_code_format)
+    rows = drw.unitfier.iter_code_format_to_file_format(drw.unitfier.iter_file_format_to_code_format(data), output[-2], output[-1])
+    if output[0] == "rows":
+        return list(rows)
+    drw.write_target(rows, output[1])
+    drw.close()
+    return output[1]
+
+
+# A function that yields the results of a function on each task, run in an executor, in the order of the tasks. At most window tasks are
+# submitted but not yet yielded, so results do not pile up in memory when they are consumed slower than they are made.
+def _ordered_map(executor: Executor, function: Callable, tasks: Iterable, window: int) -> Iterator:
+    pending = deque()
+    for task in tasks:
+        pending.append(executor.submit(function, task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class BatchUnitfier:
+
+    # The constructor takes the Unitfier whose separators/suffix (and registry cache folder) the workers use, and that makes the quantities in
+    # the main process. It also takes the number of worker processes (the number of CPUs by default, 1 reads the sources in this process).
+    def __init__(self, unitfier: Unitfier = None, processes: int = None):
+        self.unitfier = unitfier if unitfier is not None else Unitfier()
+        self.processes = processes
+
+    # A method that expands a list of sources into the sources to read. A source is a source of DataReaderWriter.iter_source (the filename
+    # of a csv, json, jsonl or xml file, the folder of a dataset, a (database, table) tuple or a "database::table" string) or a glob pattern
+    # of files. The method outputs a list of filenames and tuples.
+    @staticmethod
+    def expand_sources(sources: Union[str, List]) -> List[Union[str, tuple]]:
+        if isinstance(sources, (str, tuple)):
+            sources = [sources]
+
+        expanded = []
+        for source in sources:
+            if isinstance(source, tuple):
+                expanded.append(source)
+            elif "::" in source:
+                expanded.append(tuple(source.split("::", 1)))
+            elif glob.has_magic(source):
+                expanded.extend(sorted(glob.glob(source)))
+            else:
+                expanded.append(source)
+        return expanded
+
+    # A method that reads the sources (see expand_sources) and makes them into “code format” in a pool of worker processes. The method outputs a
+    # dictionary that maps each source to its list of dictionaries in code format, in the order of the sources, or one list with the
+    # dictionaries of all sources after each other (merge = True).
+    def unitfy_sources(self, sources: Union[str, List], merge: bool = False) -> Union[dict, List[dict]]:
+        sources = self.expand_sources(sources)
+        config = _unitfier_config(self.unitfier)
+        tasks = [(source, config) for source in sources]
+
+        if self.processes == 1:
+            results = map(_unitfy_source, tasks)
+            return self._collect(sources, results, merge)
+
+        with ProcessPoolExecutor(max_workers=self.processes) as executor:
+            return self._collect(sources, executor.map(_unitfy_source, tasks), merge)
+
+    # Makes the blocks of plain values from the workers into quantities, as they arrive in the order of the sources
+    def _collect(self, sources: List, results: Iterator[List[tuple]], merge: bool) -> Union[dict, List[dict]]:
+        if merge:
+            data = []
+            for blocks in results:
+                data.extend(self.unitfier.make_base_value_blocks_to_code_format(blocks))
+            return data
+
+        data = {}
+        for source, blocks in zip(sources, results):
+            data[source] = self.unitfier.make_base_value_blocks_to_code_format(blocks)
+        return data
+
+    # A method that unitfies one large csv or jsonl file in parallel, by splitting it into shards of about shard_size bytes that end at the
+    # end of a line (records can not contain line breaks) and reading and unitfying each shard in a worker process. The order of the rows is
+    # kept. The columns of a csv file are read with the same dtypes in every shard (see _shard_dtypes). With output_folder, each shard is
+    # made into file format (uom_in_key, uom_abbreviated) and written to a file of its own in the folder (part-00000.<output_format>, ...),
+    # and the method outputs the list of those files. With output (a target of DataReaderWriter.write_target), the shards in file format are
+    # written to that one target, in order. Without either, the method outputs a list of dictionaries in code format.
+    def unitfy_file_sharded(self, filename: str, shard_size: int = 64 * 1024 * 1024, output: str = None, output_folder: str = None,
+                            output_format: str = "jsonl", uom_in_key: bool = False, uom_abbreviated: bool = False) -> Union[List, str]:
+        header, ranges = _shard_ranges(filename, shard_size)
+        dtypes = _shard_dtypes(filename, header, ranges)
+        config = _unitfier_config(self.unitfier)
+
+        if output_folder is not None:
+            os.makedirs(output_folder, exist_ok=True)
+            outputs = [("file", os.path.join(output_folder, f"part-{i:05d}.{output_format}"), uom_in_key, uom_abbreviated) for i in range(len(ranges))]
+        elif output is not None:
+            outputs = [("rows", uom_in_key, uom_abbreviated)] * len(ranges)
+        else:
+            outputs = [None] * len(ranges)
+        tasks = [(filename, start, end, header, dtypes, config, shard_output) for (start, end), shard_output in zip(ranges, outputs)]
+
+        with ProcessPoolExecutor(max_workers=self.processes) as executor:
+            results = _ordered_map(executor, _unitfy_shard, tasks, 2 * (self.processes or os.cpu_count() or 1))
+
+            if output_folder is not None:
+                return list(results)
+
+            if output is not None:
+                drw = DataReaderWriter(unitfier=self.unitfier)
+                drw.write_target((obj for rows in results for obj in rows), output)
+                drw.close()
+                return output
+
+            data = []
+            for blocks in results:
+                data.extend(self.unitfier.make_base_value_blocks_to_code_format(blocks))
+            return data
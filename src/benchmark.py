@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from typing import Callable, List
+from unitfier import Unitfier
+from data_reader_writer import DataReaderWriter
+
+# Units that the synthetic quantity columns draw from, per dimension
+UNIT_POOLS = [
+    ["m", "cm", "mm", "km", "inch", "ft"],
+    ["kg", "g", "lb", "oz", "mg", "t"],
+    ["s", "min", "hour", "ms", "day", "week"],
+    ["K", "degC", "degF", "mK", "degR", "uK"],
+]
+
+
+# A function that generates synthetic data in file format. The function takes the number of rows, the number of quantity columns, the number of
+# distinct units per quantity column (unit_diversity) and whether the unit should be put in the key (uom_in_key = True, one key per unit) or
+# in a suffix column (uom_in_key = False). Each row also has an id and a unitless string column. The function outputs a list of dictionaries.
+def generate_file_format_data(rows: int, columns: int, unit_diversity: int = 1, uom_in_key: bool = False, seed: int = 0,
+                              unitfier: Unitfier = None) -> List[dict]:
+    u = unitfier if unitfier is not None else Unitfier()
+    rng = random.Random(seed)
+    data = []
+    for i in range(rows):
+        obj = {"id": i}
+        for col in range(columns):
+            pool = UNIT_POOLS[col % len(UNIT_POOLS)]
+            unit = pool[rng.randrange(min(max(unit_diversity, 1), len(pool)))]
+            magnitude = round(rng.uniform(0, 1000), 3)
+            if uom_in_key:
+                obj["quantity" + str(col) + u.uom_separator_start + unit + u.uom_separator_end] = magnitude
+            else:
+                obj["quantity" + str(col)] = magnitude
+                obj["quantity" + str(col) + u.uom_suffix] = unit
+        obj["string"] = "row" + str(i)
+        data.append(obj)
+    return data
+
+
+class Benchmark:
+
+    # The constructor takes the size of the synthetic data (rows, columns and distinct units per column), how many times each case is
+    # repeated, and the folder to write the files to (a temporary folder by default).
+    def __init__(self, rows: int = 10000, columns: int = 4, unit_diversity: int = 3, repeat: int = 3, folder: str = None):
+        self.rows = rows
+        self.columns = columns
+        self.unit_diversity = unit_diversity
+        self.repeat = repeat
+        self.folder = folder
+        self.results = []
+
+    # Times a function repeat times (after one untimed warm-up run, e.g. for lazy imports) and records the minimum and median wall time,
+    # together with the parameters of the case
+    def time_case(self, name: str, layout: str, function: Callable, setup: Callable = None):
+        timings = []
+        for i in range(self.repeat + 1):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            function()
+            if i > 0:
+                timings.append(time.perf_counter() - start)
+
+        self.results.append({
+            "name": name,
+            "layout": layout,
+            "rows": self.rows,
+            "columns": self.columns,
+            "unit_diversity": self.unit_diversity,
+            "repeat": self.repeat,
+            "min_s": min(timings),
+            "median_s": statistics.median(timings),
+            "rows_per_s": self.rows / min(timings) if min(timings) > 0 else None,
+        })
+
+    # Runs every format (create and read) and every Unitfier conversion, for data with the unit in the key and in a suffix column
+    def run(self) -> dict:
+        with tempfile.TemporaryDirectory() as temp_folder:
+            folder = self.folder or temp_folder
+            for uom_in_key in (False, True):
+                self.run_layout(folder, uom_in_key)
+        return self.report()
+
+    def run_layout(self, folder: str, uom_in_key: bool):
+        layout = "uom_in_key" if uom_in_key else "uom_in_value"
+        u = Unitfier()
+        drw = DataReaderWriter(unitfier=u)
+        data = generate_file_format_data(self.rows, self.columns, self.unit_diversity, uom_in_key, unitfier=u)
+
+        ### FORMATS ###
+        for file_format in ("csv", "json", "jsonl", "xml"):
+            filename = os.path.join(folder, "benchmark_" + layout + "." + file_format)
+            self.time_case("create_" + file_format, layout, lambda: getattr(drw, "create_" + file_format)(data, filename))
+            self.time_case("read_" + file_format, layout, lambda: getattr(drw, "read_" + file_format)(filename))
+
+        database = os.path.join(folder, "benchmark_" + layout + ".db")
+        drop_table = lambda: drw._get_connection(database).execute("drop table if exists benchmark")
+        self.time_case("create_database_table", layout, lambda: drw.create_database_table(data, database, "benchmark"), drop_table)
+        self.time_case("read_database_table", layout, lambda: drw.read_database_table(database, "benchmark"))
+        drw.close()
+
+        ### CONVERSIONS ###
+        import pint
+
+        code_format = u.make_file_format_to_code_format(data)
+        quantities = [value for obj in code_format[:1000] for value in obj.values() if isinstance(value, pint.Quantity)]
+        self.time_case("make_file_format_to_code_format", layout, lambda: u.make_file_format_to_code_format(data))
+        self.time_case("make_file_format_to_code_format_columnar", layout, lambda: u.make_file_format_to_code_format_columnar(data))
+        self.time_case("make_code_format_to_file_format", layout, lambda: u.make_code_format_to_file_format(code_format, uom_in_key, True))
+        columnar = u.make_file_format_to_code_format_columnar(data)
+        self.time_case("make_code_format_columnar_to_file_format", layout, lambda: u.make_code_format_columnar_to_file_format(columnar, uom_in_key, True))
+        self.time_case("make_pint_quantities_to_file_format", layout, lambda: u.make_pint_quantities_to_file_format(quantities, uom_in_key, True))
+        self.time_case("add_uom_placeholder", layout, lambda: u.add_uom_placeholder(data, uom_in_key))
+
+    # Outputs the results together with information about the environment they were measured in
+    def report(self) -> dict:
+        import pint
+
+        try:
+            commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+
+        return {
+            "metadata": {
+                "commit": commit,
+                "python": platform.python_version(),
+                "pint": pint.__version__,
+                "platform": platform.platform(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            },
+            "results": self.results,
+        }
+
+
+# A function that compares two benchmark reports. The function outputs, for each case in both reports, the ratio of the new to the old
+# minimum time (above 1 is slower).
+def compare_reports(old: dict, new: dict) -> dict:
+    old_results = {(r["name"], r["layout"]): r for r in old["results"]}
+    ratios = {}
+    for result in new["results"]:
+        key = (result["name"], result["layout"])
+        if key in old_results and old_results[key]["min_s"] > 0:
+            ratios[key[0] + "/" + key[1]] = result["min_s"] / old_results[key]["min_s"]
+    return ratios
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark reading/creating every format and every Unitfier conversion.")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--columns", type=int, default=4)
+    parser.add_argument("--unit-diversity", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="JSON file to write the report to (printed if not given)")
+    parser.add_argument("--compare", help="JSON report of an earlier run to compare the results with")
+    args = parser.parse_args()
+
+    report = Benchmark(args.rows, args.columns, args.unit_diversity, args.repeat).run()
+    if args.compare:
+        with open(args.compare) as f:
+            report["comparison"] = compare_reports(json.load(f), report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
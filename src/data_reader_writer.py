@@ -1,19 +1,232 @@
+import csv
 import json
-import pandas as pd
-from typing import List
+import os
+import shutil
+import tempfile
+import textwrap
+import uuid
+from itertools import groupby, islice
+from typing import Callable, Iterable, Iterator, List, TextIO, Union
 import sqlite3
 import xml.etree.ElementTree as ET
+from metrics import Metrics, instrumented
+from unit_table import UnitTable
+from unitfier import Unitfier
 
 
+# Decodes JSON values one at a time from a text file, reading the file in chunks. Used to stream the elements of the "data" array of a
+# JSON file without loading the whole file.
+class _JSONStreamDecoder:
+    WHITESPACE = " \t\n\r"
+    DELIMITERS = WHITESPACE + ",]}"
+
+    def __init__(self, f, buffer_size: int = 65536):
+        self._f = f
+        self._buffer_size = buffer_size
+        self._buffer = ""
+        self._pos = 0
+        self._decoder = json.JSONDecoder()
+
+    # Reads the next chunk of the file into the buffer (dropping what has been consumed). The chunk is at least as large as what is left in
+    # the buffer, so decoding a value larger than the buffer is retried a logarithmic number of times. Outputs False at the end of the file.
+    def _fill(self) -> bool:
+        chunk = self._f.read(max(self._buffer_size, len(self._buffer) - self._pos))
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return chunk != ""
+
+    def _skip_whitespace(self):
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in self.WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer) or not self._fill():
+                return
+
+    def peek(self) -> str:
+        self._skip_whitespace()
+        if self._pos >= len(self._buffer):
+            raise json.JSONDecodeError("Expecting value", self._buffer, self._pos)
+        return self._buffer[self._pos]
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if char not in chars:
+            raise json.JSONDecodeError(f"Expecting one of '{chars}'", self._buffer, self._pos)
+        self._pos += 1
+        return char
+
+    def decode(self):
+        while True:
+            self._skip_whitespace()
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number is only complete when followed by a delimiter, it may go on in the next chunk (e.g. "1" + "2.5e3")
+            if type(value) in (int, float) and (end == len(self._buffer) or self._buffer[end] not in self.DELIMITERS) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+
+# pandas is slow to import and only needed for CSV files, so it is imported in the methods that use it
 class DataReaderWriter:
+    # Table that records the unit-normalized columns of database tables, and the suffix of those columns
+    BASE_COLUMNS_TABLE = "uom_base_columns"
+    BASE_COLUMN_SUFFIX = "_base"
+
+    # Comparison operators that can be used in the predicates of query_database_table
+    QUERY_OPERATORS = {"<": "<", "<=": "<=", ">": ">", ">=": ">=", "=": "=", "==": "=", "!=": "!="}
+
+    # Modes of the create_* writers (see _check_mode)
+    WRITE_MODES = ("create", "append", "upsert")
+
+    # The constructor takes PRAGMAs (e.g. {"journal_mode": "WAL", "synchronous": "NORMAL"}) to set on each database connection. A connection
+    # is opened the first time a database is used and is reused until close() is called. The constructor also takes the Unitfier used to
+    # find the quantities (and their units) of unit-normalized tables. Calls of the read_*/iter_*/create_* methods are recorded in metrics,
+    # if given. With sqlite_check_same_thread = False the connections can be used from other threads than the one that opened them, which
+    # must then not use a connection at the same time (see AsyncDataReaderWriter).
+    def __init__(self, sqlite_pragmas: dict = None, unitfier: Unitfier = None, metrics: Metrics = None, sqlite_check_same_thread: bool = True):
+        self.metrics = metrics
+        self.sqlite_pragmas = sqlite_pragmas or {}
+        self.sqlite_check_same_thread = sqlite_check_same_thread
+        self.unitfier = unitfier if unitfier is not None else Unitfier(metrics=metrics)
+        self._connections = {}
+
+    # Closes the database connections opened by the DataReaderWriter
+    def close(self):
+        for connection in self._connections.values():
+            connection.close()
+        self._connections = {}
+
+    # Outputs the (reused) connection to the database. Transactions are handled explicitly (isolation_level=None).
+    def _get_connection(self, db: str) -> sqlite3.Connection:
+        connection = self._connections.get(db)
+        if connection is None:
+            connection = sqlite3.connect(db, isolation_level=None, check_same_thread=self.sqlite_check_same_thread)
+            for pragma, value in self.sqlite_pragmas.items():
+                connection.execute(f"pragma {pragma} = {value}")
+            self._connections[db] = connection
+        return connection
+
+    # Quotes a table or column name for use in SQL
+    @staticmethod
+    def _quote_identifier(name: str) -> str:
+        return '"' + str(name).replace('"', '""') + '"'
+
+    # Outputs the SQLite type (INTEGER, REAL or TEXT) for each column, from the values of the column in rows
+    @staticmethod
+    def _infer_column_types(rows: List[dict], columns: List[str]) -> List[str]:
+        types = []
+        for col in columns:
+            col_type = None
+            for obj in rows:
+                value = obj.get(col)
+                if value is None:
+                    continue
+                if isinstance(value, (bool, int)):
+                    value_type = "integer"
+                elif isinstance(value, float):
+                    value_type = "real"
+                else:
+                    col_type = "text"
+                    break
+                if col_type != "real":
+                    col_type = value_type
+            types.append(col_type or "text")
+        return types
+
+    # Outputs the unit-normalized columns of the table, as a dictionary that maps each quantity to a tuple of its base column and base unit
+    def _get_base_columns(self, connection: sqlite3.Connection, table: str) -> dict:
+        if not connection.execute("select name from sqlite_master where type = 'table' and name = ?", (self.BASE_COLUMNS_TABLE,)).fetchall():
+            return {}
+        rows = connection.execute("select column_name, base_column, base_unit from " + self.BASE_COLUMNS_TABLE + " where table_name = ?", (table,))
+        return {column: (base_column, base_unit) for column, base_column, base_unit in rows}
+
+    # Outputs the select statement for the columns of the table, leaving out unit-normalized columns
+    def _select_table(self, connection: sqlite3.Connection, table: str) -> str:
+        base_columns = {base_column for base_column, _ in self._get_base_columns(connection, table).values()}
+        if not base_columns:
+            return "select * from " + self._quote_identifier(table)
+
+        columns = [row[1] for row in connection.execute("select * from pragma_table_info(?)", (table,)) if row[1] not in base_columns]
+        return "select " + ",".join(self._quote_identifier(col) for col in columns) + " from " + self._quote_identifier(table)
+
+    # Yields one dictionary per row of the cursor, or one list of dictionaries per batch of batch_size rows (batched = True)
+    @staticmethod
+    def _iter_cursor(cursor: sqlite3.Cursor, batch_size: int, batched: bool) -> Iterator:
+        try:
+            columns = [col[0] for col in cursor.description]
+            while True:
+                rows = [dict(zip(columns, row)) for row in cursor.fetchmany(batch_size)]
+                if not rows:
+                    return
+                if batched:
+                    yield rows
+                else:
+                    yield from rows
+        finally:
+            cursor.close()
+
+    # Yields the rows with a unit-normalized column (the quantity name + BASE_COLUMN_SUFFIX) added for each quantity, holding its magnitude in
+    # base units. The base unit of each quantity is recorded in base_units and must be the same for all rows.
+    def _add_base_columns(self, rows: Iterable[dict], base_units: dict) -> Iterator[dict]:
+        for obj in rows:
+            new_obj = dict(obj)
+            for name, (magnitude, units) in self.unitfier.make_obj_base_magnitudes(obj).items():
+                units = str(units)
+                if base_units.setdefault(name, units) != units:
+                    import pint
+                    raise pint.errors.DimensionalityError(base_units[name], units)
+                new_obj[name + self.BASE_COLUMN_SUFFIX] = magnitude
+            yield new_obj
+
+    # A method that outputs the kind of a source or target of iter_source and write_target ("database", "csv", "json", "jsonl", "xml" or
+    # "npy") and its location: a (database, table) tuple for a "database::table" string or a (database, table) tuple, and the filename
+    # otherwise. A path without an extension (or an existing folder) is the folder of a dataset (see create_npy_dataset). Other paths raise a
+    # ValueError.
+    @staticmethod
+    def resolve_location(location: Union[str, tuple]) -> tuple:
+        if isinstance(location, tuple):
+            return "database", location
+        location = os.fspath(location)
+        if "::" in location:
+            return "database", tuple(location.split("::", 1))
+
+        extension = os.path.splitext(location)[1].lower()
+        if extension == "" or os.path.isdir(location):
+            return "npy", location
+        if extension in (".csv", ".json", ".jsonl", ".xml"):
+            return extension[1:], location
+        raise ValueError(f"'{location}' is not a csv, json, jsonl or xml file, a dataset folder, a 'database::table' string or a (database, table) "
+                         "tuple.")
 
     ### FUNCTIONS TO READ DATA INTO DICTIONARIES ###
+    @instrumented
     def read_csv(self, filename: str) -> List[dict]:
+        import pandas as pd
+
         df = pd.read_csv(filename)
-        df_dict = json.loads(df.to_json(orient='index'))
 
-        return list(df_dict.values())
+        return self._dataframe_to_dicts(df)
 
+    # Reads the csv file in chunks of chunksize rows and yields one dictionary per row, or one list of dictionaries per chunk (batched = True),
+    # so files larger than the memory can be processed
+    @instrumented
+    def iter_csv(self, filename: str, chunksize: int = 10000, batched: bool = False) -> Iterator:
+        import pandas as pd
+
+        with pd.read_csv(filename, chunksize=chunksize) as reader:
+            for df in reader:
+                rows = self._dataframe_to_dicts(df)
+                if batched:
+                    yield rows
+                else:
+                    yield from rows
+
+    @instrumented
     def read_json(self, filename: str) -> List[dict]:
         f = open(filename)
         data = json.load(f)
@@ -21,68 +234,629 @@ class DataReaderWriter:
 
         return data["data"]
 
+    # Yields the elements of the "data" array of the json file one at a time, reading the file in chunks of buffer_size characters
+    @instrumented
+    def iter_json(self, filename: str, buffer_size: int = 65536) -> Iterator[dict]:
+        with open(filename) as f:
+            decoder = _JSONStreamDecoder(f, buffer_size)
+            decoder.expect("{")
+            if decoder.peek() == "}":
+                raise KeyError("data")
+
+            while True:
+                key = decoder.decode()
+                decoder.expect(":")
+                if key == "data":
+                    decoder.expect("[")
+                    if decoder.peek() == "]":
+                        return
+                    while True:
+                        yield decoder.decode()
+                        if decoder.expect(",]") == "]":
+                            return
+                decoder.decode()
+                if decoder.expect(",}") == "}":
+                    raise KeyError("data")
+
+    @instrumented
+    def read_jsonl(self, filename: str) -> List[dict]:
+        return list(self.iter_jsonl(filename))
+
+    # Yields the object on each (non-empty) line of the json lines file
+    @instrumented
+    def iter_jsonl(self, filename: str) -> Iterator[dict]:
+        with open(filename) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    @instrumented
     def read_database_table(self, db: str, table: str) -> List[dict]:
-        connection = sqlite3.connect(db)
-        df = pd.read_sql_query(("select * from " + table), connection)
-        connection.close()
+        return list(self.iter_database_table(db, table))
 
-        df_dict = json.loads(df.to_json(orient='index'))
+    # Yields one dictionary per row of the table, or one list of dictionaries per batch of batch_size rows (batched = True). Unit-normalized
+    # columns are left out.
+    @instrumented
+    def iter_database_table(self, db: str, table: str, batch_size: int = 10000, batched: bool = False) -> Iterator:
+        connection = self._get_connection(db)
+        cursor = connection.execute(self._select_table(connection, table))
+        return self._iter_cursor(cursor, batch_size, batched)
 
-        return list(df_dict.values())
+    # Reads the rows of a unit-normalized table (see create_database_table) that match all predicates. Each predicate is a tuple of a quantity
+    # name, a comparison operator (see QUERY_OPERATORS) and a Pint quantity, e.g. ("Luggage_weight", ">", pint.Quantity(20, "kg")). The
+    # quantity is converted to the base unit of the column, so the comparison is done in SQL on the indexed unit-normalized column.
+    @instrumented
+    def query_database_table(self, db: str, table: str, predicates: List[tuple]) -> List[dict]:
+        connection = self._get_connection(db)
+        base_columns = self._get_base_columns(connection, table)
 
+        conditions = []
+        parameters = []
+        for column, operator, quantity in predicates:
+            if column not in base_columns:
+                raise ValueError(f"Table '{table}' has no unit-normalized column for '{column}'.")
+            if operator not in self.QUERY_OPERATORS:
+                raise ValueError(f"Operator '{operator}' is not one of {list(self.QUERY_OPERATORS)}.")
+
+            base_column, base_unit = base_columns[column]
+            conditions.append(self._quote_identifier(base_column) + " " + self.QUERY_OPERATORS[operator] + " ?")
+            parameters.append(float(quantity.m_as(base_unit)))
+
+        query = self._select_table(connection, table)
+        if conditions:
+            query += " where " + " and ".join(conditions)
+        query += " order by rowid"
+        return list(self._iter_cursor(connection.execute(query, parameters), 10000, False))
+
+    @instrumented
     def read_xml(self, filename: str) -> List[dict]:
-        tree = ET.parse(filename)
-        root = tree.getroot()
+        return list(self.iter_xml(filename))
+
+    # Parses the xml file incrementally and yields one dictionary per child of the root element, clearing the elements that have been
+    # processed so the memory use does not grow with the size of the file
+    @instrumented
+    def iter_xml(self, filename: str) -> Iterator[dict]:
+        root = None
+        depth = 0
+        for event, element in ET.iterparse(filename, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = element
+                depth += 1
+                continue
+
+            depth -= 1
+            if depth == 1:
+                temp_dict = {}
+                for obj in element:
+                    temp_dict[obj.tag] = obj.text
+                yield temp_dict
+                root.clear()
+
+    # Reads a dataset written by create_npy_dataset into columnar data. Quantity columns are Pint quantities of the stored arrays, with the unit of
+    # the column parsed once; with mmap = True the arrays are memory-mapped (read-only), so nothing is read until it is used. Numeric columns
+    # without UoM information are NumPy arrays and other columns lists.
+    @instrumented
+    def read_npy_dataset(self, folder: str, mmap: bool = True) -> dict:
+        import numpy as np
 
-        data = []
-        for d in root:
-            temp_dict = {}
-            for obj in d:
-                temp_dict[obj.tag] = obj.text
-            data.append(temp_dict)
+        with open(os.path.join(folder, "manifest.json")) as f:
+            manifest = json.load(f)
 
+        data = {}
+        for column in manifest["columns"]:
+            path = os.path.join(folder, column["file"])
+            if column["kind"] == "json":
+                with open(path) as f:
+                    data[column["name"]] = json.load(f)
+                continue
+
+            array = np.load(path, mmap_mode="r" if mmap else None)
+            if column["kind"] == "quantity":
+                data[column["name"]] = self.unitfier.Quantity(array, column["unit"])
+            else:
+                data[column["name"]] = array
         return data
 
+    # Reads the csv file into a pandas DataFrame in code format, with one float column per quantity and its unit in df.attrs["units"] or in
+    # a pint-pandas dtype (see Unitfier.make_file_format_dataframe_to_code_format), without making dictionaries or Pint quantities per row
+    @instrumented
+    def read_csv_dataframe(self, filename: str, target_units: Union[str, dict] = None, pint_dtypes: bool = False):
+        import pandas as pd
+
+        return self.unitfier.make_file_format_dataframe_to_code_format(pd.read_csv(filename), target_units, pint_dtypes)
+
+    # Reads the table into a pandas DataFrame in code format, like read_csv_dataframe. Unit-normalized columns are left out.
+    @instrumented
+    def read_database_table_dataframe(self, db: str, table: str, target_units: Union[str, dict] = None, pint_dtypes: bool = False):
+        import pandas as pd
+
+        connection = self._get_connection(db)
+        df = pd.read_sql_query(self._select_table(connection, table), connection)
+        return self.unitfier.make_file_format_dataframe_to_code_format(df, target_units, pint_dtypes)
+
+    # A method that reads a source as dictionaries in file format: the filename of a csv, json, jsonl or xml file, the folder of a dataset, a
+    # "database::table" string or a (database, table) tuple (see resolve_location). Files and tables are streamed with their iter_* method.
+    def iter_source(self, source: Union[str, tuple]) -> Iterator[dict]:
+        kind, location = self.resolve_location(source)
+        if kind == "database":
+            return self.iter_database_table(*location)
+        if kind == "npy":
+            return iter(self.unitfier.make_code_format_columnar_to_file_format(self.read_npy_dataset(location)))
+        return getattr(self, "iter_" + kind)(location)
+
+    # Makes the rows of a DataFrame into dictionaries of plain Python values, with None for missing values
+    @staticmethod
+    def _dataframe_to_dicts(df) -> List[dict]:
+        return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+
     ### FUNCTIONS TO CREATE DATA FILES/TABLE FROM DICTIONARIES ###
-    def create_csv(self, data: List[dict], filename: str):
-        df = pd.DataFrame.from_records(data)
-        df.to_csv(filename, index=False)
-    
-    def create_json(self, data: List[dict], filename: str):
-        with open(filename, "w") as outfile:
-            outfile.write(json.dumps({"data": data}, indent=4))
-    
-    def create_xml(self, data: List[dict], filename: str):
-        xml_data = ET.Element("data")
+    # The create_* writers also take a UnitTable, which is written in file format with the UoM in a suffix column (see
+    # Unitfier.make_code_format_to_file_format)
+    def _file_format_rows(self, data: Union[Iterable[dict], UnitTable]) -> Iterable[dict]:
+        if isinstance(data, UnitTable):
+            return self.unitfier.iter_code_format_to_file_format(data)
+        return data
+
+    # The create_* writers take a mode: "create" writes a new file (a database table is created if it does not exist), "append" adds the
+    # rows to an existing file or table (or creates it), and "upsert" also merges a new row into the row that has the same key: the columns
+    # of the new row are updated and the columns it lacks keep their values. The key is a column, or a list of columns, given with the
+    # upsert mode. The method outputs the key as a list of columns (None for other modes).
+    @staticmethod
+    def _check_mode(mode: str, key: Union[str, List[str]]) -> List[str]:
+        if mode not in DataReaderWriter.WRITE_MODES:
+            raise ValueError(f"Mode '{mode}' is not one of 'create', 'append' and 'upsert'.")
+        if mode != "upsert":
+            return None
+        if not key:
+            raise ValueError("The upsert mode needs a key.")
+        return [key] if isinstance(key, str) else list(key)
+
+    # Whether rows can be appended to the file, i.e. it exists and is not empty
+    @staticmethod
+    def _can_append(filename: str) -> bool:
+        return os.path.exists(filename) and os.path.getsize(filename) > 0
+
+    # Writes a file (write is a function of the filename to write to) to a temporary file next to it, which then replaces the file
+    @staticmethod
+    def _replace_file(filename: str, write: Callable):
+        folder, name = os.path.split(os.path.abspath(filename))
+        fd, temp_filename = tempfile.mkstemp(prefix="." + name + ".", suffix=os.path.splitext(name)[1], dir=folder)
+        os.close(fd)
+        try:
+            write(temp_filename)
+            if os.path.exists(filename):
+                shutil.copymode(filename, temp_filename)
+            os.replace(temp_filename, filename)
+        except BaseException:
+            os.remove(temp_filename)
+            raise
 
+    # Upserts the rows of data into a file by rewriting it: the rows of the file are streamed from read (e.g. iter_json) to write (e.g.
+    # create_json), a new row is merged into the row with the same key (see _check_mode), and the other new rows are written at the end. The
+    # key of a row is made from the values of its key columns with as_key (e.g. to compare them as text). The new rows are kept in memory.
+    def _upsert_file(self, data: Iterable[dict], filename: str, key: List[str], read: Callable, write: Callable, as_key: Callable = tuple):
+        new_rows = {}
         for obj in data:
-            temp_obj = ET.SubElement(xml_data, 'obj')
-            for key in obj:
-                el = ET.SubElement(temp_obj, key)
-                el.text = str(obj[key])
-
-        xml_binary = ET.tostring(xml_data)
-        with open(filename, "wb") as f:
-            f.write(xml_binary)
-
-    def create_database_table(self, data: List[dict], database: str, table: str):
-        df = pd.DataFrame.from_records(data)
-
-        connection = sqlite3.connect(database)
-        cursor = connection.cursor()
-
-        cols = ""
-        q_marks = ""
-        for col in list(df.columns.values):
-            cols += col+" text,"
-            q_marks += "?,"
-        cols = cols[:-1]
-        q_marks = q_marks[:-1]
-
-        rows = df.values.tolist()
-        
-        cursor.execute("create table if not exists  "+table+"("+cols+")")
-        cursor.executemany("insert into "+table+" values (" + q_marks + ")", rows)        
-        connection.commit()
-        
-        connection.close()
+            obj_key = as_key(obj.get(col) for col in key)
+            new_rows[obj_key] = {**new_rows[obj_key], **obj} if obj_key in new_rows else obj
+
+        def rows():
+            if self._can_append(filename):
+                for obj in read(filename):
+                    new_obj = new_rows.pop(as_key(obj.get(col) for col in key), None)
+                    yield obj if new_obj is None else {**obj, **new_obj}
+            yield from new_rows.values()
+
+        self._replace_file(filename, lambda temp_filename: write(rows(), temp_filename))
+
+    # Outputs the key of a row of a text format (csv or xml) from the values of its key columns, as the values are written to the file
+    @staticmethod
+    def _text_key(values: Iterable) -> tuple:
+        return tuple("" if value is None else str(value) for value in values)
+
+    # Moves the end of a file written by create_json or create_xml (end, or empty_end for a file without rows, ignoring trailing whitespace)
+    # from the file, keeping the first keep_empty bytes of empty_end, so rows can be appended in place. The method outputs whether the file
+    # holds no rows. A file that does not end like that raises a ValueError.
+    @staticmethod
+    def _truncate_end(filename: str, end: bytes, empty_end: bytes, keep_empty: int) -> bool:
+        with open(filename, "r+b") as f:
+            size = f.seek(0, os.SEEK_END)
+            start = f.seek(max(0, size - 64))
+            tail = f.read().rstrip()
+            if tail.endswith(end):
+                f.truncate(start + len(tail) - len(end))
+                return False
+            if tail.endswith(empty_end):
+                f.truncate(start + len(tail) - len(empty_end) + keep_empty)
+                return True
+        raise ValueError(f"Rows can not be appended to '{filename}', as it does not end like a file written by the create_* writers.")
+
+    # Writes the dictionaries of data (which can be an iterator) in chunks of chunksize rows. The columns are taken from the first chunk, and a
+    # later chunk with keys the file lacks makes the file be rewritten once with the new columns added (empty in the earlier rows), so no key
+    # is dropped. In append mode the rows are added to the end of the file, in its columns (new columns are added the same way). In upsert
+    # mode the file is rewritten (see _upsert_file), with the keys compared as text.
+    @instrumented
+    def create_csv(self, data: Union[Iterable[dict], UnitTable], filename: str, chunksize: int = 10000, mode: str = "create",
+                   key: Union[str, List[str]] = None):
+        import pandas as pd
+
+        key = self._check_mode(mode, key)
+        rows = iter(self._file_format_rows(data))
+        if mode == "upsert":
+            # The file is rewritten with the columns of the file and of the new rows, so no chunk needs to add columns
+            rows = list(rows)
+            columns = []
+            if self._can_append(filename):
+                with open(filename, newline="") as f:
+                    columns = next(csv.reader(f), [])
+            known_columns = set(columns)
+            columns += [col for col in dict.fromkeys(col for obj in rows for col in obj) if col not in known_columns]
+
+            def write(rows, temp_filename):
+                pd.DataFrame(columns=columns).to_csv(temp_filename, index=False)
+                self.create_csv(rows, temp_filename, chunksize, mode="append")
+            self._upsert_file(rows, filename, key, self._iter_csv_text, write, self._text_key)
+            return
+
+        chunk = list(islice(rows, chunksize))
+        if mode == "append" and self._can_append(filename):
+            with open(filename, newline="") as f:
+                columns = next(csv.reader(f), [])
+        else:
+            df = pd.DataFrame.from_records(chunk)
+            df.to_csv(filename, index=False)
+            columns = list(df.columns)
+            chunk = list(islice(rows, chunksize))
+
+        while chunk:
+            known_columns = set(columns)
+            new_columns = [col for col in dict.fromkeys(col for obj in chunk for col in obj) if col not in known_columns]
+            if new_columns:
+                self._replace_file(filename, lambda temp_filename: self._add_csv_columns(filename, temp_filename, new_columns))
+                columns = columns + new_columns
+            pd.DataFrame.from_records(chunk, columns=columns).to_csv(filename, index=False, header=False, mode="a")
+            chunk = list(islice(rows, chunksize))
+
+    # Yields the rows of a csv file as dictionaries of the text of each field, so they can be written back unchanged
+    @staticmethod
+    def _iter_csv_text(filename: str) -> Iterator[dict]:
+        with open(filename, newline="") as f:
+            yield from csv.DictReader(f)
+
+    # Copies a csv file to target_filename with new columns, empty in each row, added to the end of each line
+    @staticmethod
+    def _add_csv_columns(filename: str, target_filename: str, new_columns: List[str]):
+        with open(filename, newline="") as f, open(target_filename, "w", newline="") as target:
+            reader = csv.reader(f)
+            writer = csv.writer(target, lineterminator=os.linesep)
+            columns = next(reader, [])
+            writer.writerow(columns + new_columns)
+            for row in reader:
+                writer.writerow(row + [""] * (len(columns) + len(new_columns) - len(row)))
+
+    # Writes each dictionary to the file as it arrives from data (which can be an iterator), formatted as json.dumps({"data": data}, indent=4).
+    # In append mode the rows are written in place before the end of the "data" array, and in upsert mode the file is rewritten (see _upsert_file).
+    @instrumented
+    def create_json(self, data: Union[Iterable[dict], UnitTable], filename: str, mode: str = "create", key: Union[str, List[str]] = None):
+        key = self._check_mode(mode, key)
+        if mode == "upsert":
+            self._upsert_file(self._file_format_rows(data), filename, key, self.iter_json, self.create_json)
+            return
+
+        empty = True
+        append = mode == "append" and self._can_append(filename)
+        if append:
+            linesep = os.linesep.encode()
+            empty = self._truncate_end(filename, b"\n    ]\n}".replace(b"\n", linesep), b"[]\n}".replace(b"\n", linesep), 1)
+        with open(filename, "a" if append else "w") as outfile:
+            if not append:
+                outfile.write('{\n    "data": [')
+            for obj in self._file_format_rows(data):
+                outfile.write(("\n" if empty else ",\n") + textwrap.indent(json.dumps(obj, indent=4), " " * 8))
+                empty = False
+            outfile.write("]\n}" if empty else "\n    ]\n}")
+
+    # Writes one dictionary per line as it arrives from data (which can be an iterator). In append mode the lines are added to the end of the
+    # file, and in upsert mode the file is rewritten (see _upsert_file).
+    @instrumented
+    def create_jsonl(self, data: Union[Iterable[dict], UnitTable], filename: str, mode: str = "create", key: Union[str, List[str]] = None):
+        key = self._check_mode(mode, key)
+        if mode == "upsert":
+            self._upsert_file(self._file_format_rows(data), filename, key, self.iter_jsonl, self.create_jsonl)
+            return
+
+        with self._open_jsonl(filename, mode == "append") as outfile:
+            for obj in self._file_format_rows(data):
+                outfile.write(json.dumps(obj) + "\n")
+
+    # Opens a jsonl file to write lines to: a new file, or in append mode the end of the file, after a line break that is added if the last
+    # line lacks it
+    def _open_jsonl(self, filename: str, append: bool) -> TextIO:
+        append = append and self._can_append(filename)
+        outfile = open(filename, "a" if append else "w")
+        if append:
+            with open(filename, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    outfile.write("\n")
+        return outfile
+
+    # Writes each dictionary to the file as it arrives from data (which can be an iterator), so only one <obj> element is in memory at a time.
+    # In append mode the elements are written in place before </data>, and in upsert mode the file is rewritten (see _upsert_file), with the
+    # keys compared as text.
+    @instrumented
+    def create_xml(self, data: Union[Iterable[dict], UnitTable], filename: str, mode: str = "create", key: Union[str, List[str]] = None):
+        key = self._check_mode(mode, key)
+        if mode == "upsert":
+            self._upsert_file(self._file_format_rows(data), filename, key, self.iter_xml, self.create_xml, self._text_key)
+            return
+
+        empty = True
+        append = mode == "append" and self._can_append(filename)
+        if append:
+            empty = self._truncate_end(filename, b"</data>", b"<data />", 0)
+        with open(filename, "ab" if append else "wb") as f:
+            for obj in self._file_format_rows(data):
+                if empty:
+                    f.write(b"<data>")
+                    empty = False
+
+                temp_obj = ET.Element('obj')
+                for key in obj:
+                    el = ET.SubElement(temp_obj, key)
+                    el.text = str(obj[key])
+                f.write(ET.tostring(temp_obj))
+
+            f.write(b"<data />" if empty else b"</data>")
+
+    # A method that writes dictionaries in file format (or a UnitTable) to a target with its create_* writer, in the mode (with the key) of
+    # the writer: the filename of a csv, json, jsonl or xml file, the folder of a dataset, a "database::table" string or a (database, table)
+    # tuple (see resolve_location). The rows written to a dataset are made into columnar data first.
+    def write_target(self, data: Union[Iterable[dict], UnitTable], target: Union[str, tuple], mode: str = "create",
+                     key: Union[str, List[str]] = None):
+        kind, location = self.resolve_location(target)
+        if kind == "database":
+            self.create_database_table(data, *location, mode=mode, key=key)
+        elif kind == "npy":
+            if not isinstance(data, UnitTable):
+                data = self.unitfier.make_file_format_to_code_format_columnar(list(data))
+            self.create_npy_dataset(data, location, mode)
+        else:
+            getattr(self, "create_" + kind)(data, location, mode=mode, key=key)
+
+    # Writes a pandas DataFrame in code format (see read_csv_dataframe) to a target of write_target, with the UoM in a suffix column or in the
+    # key (uom_in_key) as in Unitfier.make_code_format_to_file_format. A new csv file and a dataset are written from the columns, a jsonl file
+    # (except in upsert mode) with DataFrame.to_json (floats with 15 significant digits) and a database table (except a unit-normalized one)
+    # with one executemany per chunk of chunksize rows (see _insert_dataframe). The other targets are passed to write_target, with the mode
+    # and key, in chunks of chunksize rows of plain values.
+    @instrumented
+    def create_from_dataframe(self, data, target: Union[str, tuple], uom_in_key: bool = False, uom_abbreviated: bool = False,
+                              chunksize: int = 10000, mode: str = "create", key: Union[str, List[str]] = None):
+        kind, location = self.resolve_location(target)
+        if kind == "npy":
+            self.create_npy_dataset(self.unitfier.make_code_format_dataframe_to_columnar(data), location, mode)
+            return
+
+        df = self.unitfier.make_code_format_dataframe_to_file_format(data, uom_in_key, uom_abbreviated)
+        if kind == "csv" and mode == "create":
+            df.to_csv(location, index=False)
+            return
+        if kind == "jsonl" and mode != "upsert":
+            self._check_mode(mode, key)
+            with self._open_jsonl(location, mode == "append") as outfile:
+                for start in range(0, len(df), chunksize):
+                    outfile.write(df.iloc[start:start + chunksize].to_json(orient="records", lines=True, double_precision=15))
+            return
+        if kind == "database" and not self._get_base_columns(self._get_connection(location[0]), location[1]):
+            self._insert_dataframe(df, *location, chunksize, mode, key)
+            return
+
+        rows = (obj for start in range(0, len(df), chunksize) for obj in self._dataframe_to_dicts(df.iloc[start:start + chunksize]))
+        self.write_target(rows, target, mode, key)
+
+    # Writes columnar data (e.g. from Unitfier.make_file_format_to_code_format_columnar) to a folder as a binary dataset: one .npy file per
+    # column and a manifest.json with the name, kind and unit of each column. A quantity column is stored as one contiguous float array with
+    # its unit recorded once in the manifest. Columns of numbers are stored as arrays too, and other columns (e.g. strings) as json. A UnitTable
+    # is written from its columns. In append mode the columns are added to the end of those of the dataset (see _append_columnar); the upsert
+    # mode is not supported for datasets. The dataset is written to a new folder that then replaces the folder (see _replace_folder).
+    @instrumented
+    def create_npy_dataset(self, data: Union[dict, UnitTable], folder: str, mode: str = "create"):
+        if mode == "upsert":
+            raise ValueError("The upsert mode is not supported for npy datasets.")
+        self._check_mode(mode, None)
+        if isinstance(data, UnitTable):
+            data = data.to_columnar()
+        if mode == "append" and os.path.exists(os.path.join(folder, "manifest.json")):
+            data = self._append_columnar(self.read_npy_dataset(folder, mmap=False), data)
+        self._replace_folder(folder, lambda temp_folder: self._write_npy_dataset(data, temp_folder))
+
+    # Writes columnar data to an empty folder as a dataset (see create_npy_dataset)
+    @staticmethod
+    def _write_npy_dataset(data: dict, folder: str):
+        import numpy as np
+        import pint
+
+        columns = []
+        for i, (name, values) in enumerate(data.items()):
+            if isinstance(values, pint.Quantity):
+                column = {"name": name, "kind": "quantity", "file": f"column_{i:05d}.npy", "unit": str(values.units)}
+                np.save(os.path.join(folder, column["file"]), np.ascontiguousarray(values.magnitude, dtype=float))
+            elif isinstance(values, np.ndarray) or all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+                column = {"name": name, "kind": "array", "file": f"column_{i:05d}.npy"}
+                np.save(os.path.join(folder, column["file"]), np.asarray(values))
+            else:
+                column = {"name": name, "kind": "json", "file": f"column_{i:05d}.json"}
+                with open(os.path.join(folder, column["file"]), "w") as f:
+                    json.dump(list(values), f)
+            columns.append(column)
+
+        with open(os.path.join(folder, "manifest.json"), "w") as f:
+            json.dump({"rows": max((len(values) for values in data.values()), default=0), "columns": columns}, f, indent=4)
+
+    # Writes a dataset folder (write is a function of the folder to write to) to a new folder next to it, which then replaces the folder. The
+    # old folder is moved aside first and removed after, so a reader finds the old or the new dataset but never a half-written one, no column
+    # files of the old dataset are left behind, and arrays memory-mapped from the old files keep their values. A folder that is not empty and
+    # holds no dataset (no manifest.json) raises a ValueError instead of being replaced.
+    @staticmethod
+    def _replace_folder(folder: str, write: Callable):
+        folder = os.path.abspath(folder)
+        if os.path.isdir(folder) and os.listdir(folder) and not os.path.exists(os.path.join(folder, "manifest.json")):
+            raise ValueError(f"Folder '{folder}' is not empty and holds no dataset.")
+
+        parent, name = os.path.split(folder)
+        os.makedirs(parent, exist_ok=True)
+        temp_folder = os.path.join(parent, f".{name}.tmp-{uuid.uuid4().hex}")
+        os.mkdir(temp_folder)
+        try:
+            write(temp_folder)
+        except BaseException:
+            shutil.rmtree(temp_folder, ignore_errors=True)
+            raise
+
+        old_folder = None
+        if os.path.exists(folder):
+            shutil.copymode(folder, temp_folder)
+            old_folder = temp_folder + ".old"
+            os.replace(folder, old_folder)
+        os.replace(temp_folder, folder)
+        if old_folder is not None:
+            shutil.rmtree(old_folder, ignore_errors=True)
+
+    # Outputs the rows of the columnar data new added to the end of the columnar data old. A quantity column is converted to the unit of the
+    # old column, and a column that one of them lacks is padded with NaN (quantities and float arrays) or None.
+    @staticmethod
+    def _append_columnar(old: dict, new: dict) -> dict:
+        import numpy as np
+        import pint
+
+        old_rows = max((len(values) for values in old.values()), default=0)
+        new_rows = max((len(values) for values in new.values()), default=0)
+        data = {}
+        for name in dict.fromkeys([*old, *new]):
+            old_values, new_values = old.get(name), new.get(name)
+            quantity = old_values if isinstance(old_values, pint.Quantity) else new_values
+            if isinstance(quantity, pint.Quantity):
+                units = quantity.units
+                magnitudes = [np.full(rows, np.nan) if values is None else values.m_as(units)
+                              for values, rows in ((old_values, old_rows), (new_values, new_rows))]
+                data[name] = type(quantity)(np.concatenate(magnitudes), units)
+            elif all(isinstance(values, np.ndarray) and values.dtype.kind == "f" or values is None for values in (old_values, new_values)):
+                data[name] = np.concatenate([np.full(rows, np.nan) if values is None else values
+                                             for values, rows in ((old_values, old_rows), (new_values, new_rows))])
+            elif all(isinstance(values, np.ndarray) for values in (old_values, new_values)):
+                data[name] = np.concatenate([old_values, new_values])
+            else:
+                data[name] = [value for values, rows in ((old_values, old_rows), (new_values, new_rows))
+                              for value in ([None] * rows if values is None else values.tolist() if isinstance(values, np.ndarray) else values)]
+        return data
+
+    # Inserts the dictionaries of data (which can be an iterator) in batches of batch_size rows, all in one transaction. The table is
+    # created if it does not exist, and the columns of each batch that the table lacks are added to it; the type of a column (INTEGER, REAL
+    # or TEXT) is taken from the batch that adds it. In upsert mode a unique index is created on the key columns, and a row with the key of
+    # a row of the table is merged into that row (see _check_mode): each row is written with a statement for its own columns. With
+    # unit_normalized = True, a REAL column with the magnitude in base units is added, and indexed, for each quantity (found with the
+    # Unitfier), so it can be used by query_database_table. The base columns of a unit-normalized table are kept up to date by every later
+    # insert or upsert, with or without unit_normalized = True. The create and append modes both add the rows to the table.
+    @instrumented
+    def create_database_table(self, data: Union[Iterable[dict], UnitTable], database: str, table: str, batch_size: int = 10000, unit_normalized: bool = False,
+                              mode: str = "create", key: Union[str, List[str]] = None):
+        key = self._check_mode(mode, key)
+        connection = self._get_connection(database)
+
+        rows = iter(self._file_format_rows(data))
+        base_units = {column: base_unit for column, (_, base_unit) in self._get_base_columns(connection, table).items()}
+        unit_normalized = unit_normalized or bool(base_units)
+        if unit_normalized:
+            rows = self._add_base_columns(rows, base_units)
+
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+
+        quoted_table = self._quote_identifier(table)
+        connection.execute("begin")
+        try:
+            table_columns = [row[1] for row in connection.execute("select * from pragma_table_info(?)", (table,))]
+            inserts = {}
+            while batch:
+                # The consecutive rows with the same columns (usually the whole batch) share a statement
+                for columns, group in groupby(batch, key=tuple):
+                    insert = inserts.get(columns)
+                    if insert is None:
+                        insert = inserts[columns] = self._prepare_insert(connection, table, table_columns, columns, key, batch)
+                    connection.executemany(insert, [tuple(obj.values()) for obj in group])
+                batch = list(islice(rows, batch_size))
+
+            if unit_normalized:
+                connection.execute("create table if not exists " + self.BASE_COLUMNS_TABLE +
+                                   "(table_name text, column_name text, base_column text, base_unit text, primary key (table_name, column_name))")
+                for column, base_unit in base_units.items():
+                    base_column = column + self.BASE_COLUMN_SUFFIX
+                    if base_column not in table_columns:
+                        continue
+                    connection.execute("insert or replace into " + self.BASE_COLUMNS_TABLE + " values (?, ?, ?, ?)", (table, column, base_column, base_unit))
+                    connection.execute("create index if not exists " + self._quote_identifier("idx_" + table + "_" + base_column) +
+                                       " on " + quoted_table + "(" + self._quote_identifier(base_column) + ")")
+            connection.execute("commit")
+        except BaseException:
+            connection.execute("rollback")
+            raise
+
+    # Inserts the rows of a DataFrame in file format into the table like create_database_table, in one transaction, without making a
+    # dictionary per row: each chunk of chunksize rows is passed to executemany as tuples. The types of new columns are taken from the first
+    # chunk.
+    def _insert_dataframe(self, df, database: str, table: str, chunksize: int, mode: str, key: Union[str, List[str]]):
+        key = self._check_mode(mode, key)
+        if df.empty:
+            return
+
+        connection = self._get_connection(database)
+        columns = tuple(df.columns)
+        connection.execute("begin")
+        try:
+            table_columns = [row[1] for row in connection.execute("select * from pragma_table_info(?)", (table,))]
+            rows = self._dataframe_to_dicts(df.iloc[:chunksize]) if any(col not in table_columns for col in columns) else []
+            insert = self._prepare_insert(connection, table, table_columns, columns, key, rows)
+            for start in range(0, len(df), chunksize):
+                chunk = df.iloc[start:start + chunksize]
+                connection.executemany(insert, chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None))
+            connection.execute("commit")
+        except BaseException:
+            connection.execute("rollback")
+            raise
+
+    # Outputs the insert statement (see _insert_statement) for rows with the columns, after adding the columns the table lacks, with the
+    # types of their values in rows, and in upsert mode the unique index on the key columns
+    def _prepare_insert(self, connection: sqlite3.Connection, table: str, table_columns: List[str], columns: tuple, key: List[str],
+                        rows: List[dict]) -> str:
+        quoted_table = self._quote_identifier(table)
+        new_columns = [col for col in columns if col not in table_columns]
+        if new_columns:
+            self._add_table_columns(connection, table, table_columns, new_columns, self._infer_column_types(rows, new_columns))
+        if key is not None:
+            connection.execute("create unique index if not exists " + self._quote_identifier("uidx_" + table + "_" + "_".join(key)) +
+                               " on " + quoted_table + "(" + ",".join(self._quote_identifier(col) for col in key) + ")")
+        return self._insert_statement(quoted_table, columns, key)
+
+    # Creates the table with the new columns, or adds them to it, and adds them to table_columns
+    def _add_table_columns(self, connection: sqlite3.Connection, table: str, table_columns: List[str], new_columns: List[str], types: List[str]):
+        quoted_table = self._quote_identifier(table)
+        if not table_columns:
+            cols = ",".join(self._quote_identifier(col) + " " + col_type for col, col_type in zip(new_columns, types))
+            connection.execute("create table " + quoted_table + "(" + cols + ")")
+        else:
+            for col, col_type in zip(new_columns, types):
+                connection.execute("alter table " + quoted_table + " add column " + self._quote_identifier(col) + " " + col_type)
+        table_columns.extend(new_columns)
+
+    # Outputs the insert statement for rows with the columns, which updates the row with the same key instead (an upsert) if a key is given
+    def _insert_statement(self, quoted_table: str, columns: tuple, key: List[str]) -> str:
+        insert = ("insert into " + quoted_table + "(" + ",".join(self._quote_identifier(col) for col in columns) + ") values (" +
+                  ",".join("?" for _ in columns) + ")")
+        if key is None:
+            return insert
+
+        updates = [self._quote_identifier(col) + " = excluded." + self._quote_identifier(col) for col in columns if col not in key]
+        conflict = " on conflict(" + ",".join(self._quote_identifier(col) for col in key) + ") do "
+        return insert + conflict + ("update set " + ",".join(updates) if updates else "nothing")
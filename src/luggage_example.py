@@ -34,16 +34,16 @@ class LuggageExample:
         u = Unitfier()
 
         # Read data and make quantaties
-        data = u.make_file_format_to_code_format(
-            drw.read_database_table("../data/data.db", "luggage_data_with_uom"))
+        file_data = drw.read_database_table("../data/data.db", "luggage_data_with_uom")
+        data = u.make_file_format_to_code_format(file_data)
 
-        # Output elements and calculate the total weight
-        total_luggage_weight = 0
+        # Output elements
         for passenger in data:
             print(
                 f"Val: {passenger['Luggage_weight']}, Type: {type(passenger['Luggage_weight'])}")
 
-            total_luggage_weight += passenger["Luggage_weight"]
+        # Calculate the total weight (each unit is converted once and the weights are summed as one array)
+        total_luggage_weight = u.aggregate(file_data, "Luggage_weight", "sum")
 
         # Make data into file format and output into JSON file
         total_luggage_weight_file_format = u.make_code_format_to_file_format(
@@ -0,0 +1,172 @@
+import functools
+import json
+import os
+import threading
+import time
+import types
+from typing import Callable, List
+
+
+# Collects one record per instrumented call (see instrumented) of a Unitfier or DataReaderWriter that it is given to. Each record holds the
+# class and method (stage), the wall time, the self time (the wall time without the time spent in nested instrumented calls, e.g. in the
+# generator a streaming method consumes, so the self times of a pipeline add up to its wall time), the number of rows, the bytes
+# read/written (for files) and, for Unitfier calls, the statistics of the unit cache. Hooks are called with each record as it is made.
+class Metrics:
+
+    def __init__(self, hooks: List[Callable] = None):
+        self.hooks = hooks or []
+        self.records = []
+        self._local = threading.local()
+
+    # Adds a record and passes it to the hooks
+    def record(self, record: dict):
+        self.records.append(record)
+        for hook in self.hooks:
+            hook(record)
+
+    # Outputs the records summed per stage
+    def summary(self) -> dict:
+        summary = {}
+        for record in self.records:
+            stage = summary.setdefault(record["stage"], {"calls": 0, "wall_time_s": 0.0, "self_time_s": 0.0, "rows": 0, "bytes_read": 0,
+                                                         "bytes_written": 0})
+            stage["calls"] += 1
+            stage["wall_time_s"] += record["wall_time_s"]
+            stage["self_time_s"] += record["self_time_s"]
+            for key in ("rows", "bytes_read", "bytes_written"):
+                stage[key] += record.get(key) or 0
+        return summary
+
+    # Writes the summary and the records to a json file
+    def to_json(self, filename: str):
+        with open(filename, "w") as outfile:
+            json.dump({"summary": self.summary(), "records": self.records}, outfile, indent=4)
+
+    def clear(self):
+        self.records = []
+
+    # The timed calls and generator steps running in the current thread, innermost last, each a list holding the time spent in the timed
+    # calls and steps nested in it. Calls made inside an instrumented call are not recorded twice.
+    @property
+    def _stack(self) -> list:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    # Calls function and adds the time it takes to the wall time of record, and that time minus the time of nested timed calls and steps
+    # to its self time. The time is then subtracted from the self time of the enclosing call or step.
+    def _time(self, record: dict, function: Callable):
+        stack = self._stack
+        nested = [0.0]
+        stack.append(nested)
+        start = time.perf_counter()
+        try:
+            return function()
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            record["wall_time_s"] += elapsed
+            record["self_time_s"] += elapsed - nested[0]
+            if stack:
+                stack[-1][0] += elapsed
+
+
+# Counts the rows passing through an iterable, used to count the rows of data given to a method as an iterator
+class _RowCounter:
+
+    def __init__(self, data):
+        self.data = data
+        self.rows = 0
+
+    def __iter__(self):
+        for obj in self.data:
+            self.rows += 1
+            yield obj
+
+
+def _count_rows(result):
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict):
+        # Columnar data, one list/array per column
+        return max((len(column) for column in result.values()), default=0)
+    if (hasattr(result, "names") or hasattr(result, "columns")) and hasattr(result, "__len__"):
+        # A UnitTable or a pandas DataFrame
+        return len(result)
+    return None
+
+
+def _file_size(filename) -> int:
+    try:
+        return os.path.getsize(filename)
+    except (OSError, TypeError):
+        return None
+
+
+# A decorator for the methods of Unitfier and DataReaderWriter that records a call in the Metrics object of the instance (self.metrics).
+# When self.metrics is None the method is called directly. Generators are timed while they are consumed and recorded when they are exhausted.
+def instrumented(method: Callable) -> Callable:
+    code = method.__code__
+    parameters = code.co_varnames[1:code.co_argcount]
+    stage = method.__qualname__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        metrics = self.metrics
+        if metrics is None or metrics._stack:
+            return method(self, *args, **kwargs)
+
+        arguments = dict(zip(parameters, args))
+        arguments.update(kwargs)
+        record = {"stage": stage, "wall_time_s": 0.0, "self_time_s": 0.0, "rows": None, "bytes_read": None, "bytes_written": None}
+
+        # Count the rows of data given as an iterator while the method consumes it
+        counter = None
+        if "data" in arguments and not hasattr(arguments["data"], "__len__"):
+            counter = _RowCounter(arguments["data"])
+            if "data" in kwargs:
+                kwargs["data"] = counter
+            else:
+                args = args[:parameters.index("data")] + (counter,) + args[parameters.index("data") + 1:]
+        elif "data" in arguments:
+            record["rows"] = _count_rows(arguments["data"])
+
+        filename = arguments.get("filename", arguments.get("db", arguments.get("database", arguments.get("target"))))
+        if stage.startswith("DataReaderWriter.read_") or stage.startswith("DataReaderWriter.iter_"):
+            record["bytes_read"] = _file_size(filename)
+
+        def finish(rows):
+            if counter is not None:
+                record["rows"] = counter.rows
+            elif record["rows"] is None:
+                record["rows"] = rows
+            if stage.startswith("DataReaderWriter.create_"):
+                record["bytes_written"] = _file_size(filename)
+            if hasattr(self, "cache_info"):
+                record["unit_cache"] = self.cache_info()["units"]
+            metrics.record(record)
+
+        result = metrics._time(record, functools.partial(method, self, *args, **kwargs))
+
+        if isinstance(result, types.GeneratorType):
+            return _instrument_generator(metrics, record, result, finish)
+
+        finish(_count_rows(result))
+        return result
+
+    return wrapper
+
+
+# Times the steps of a generator and counts the rows (or the rows in each batch) it yields, then records the call when it is exhausted
+def _instrument_generator(metrics: Metrics, record: dict, generator, finish: Callable):
+    rows = 0
+    step = functools.partial(next, generator)
+    while True:
+        try:
+            item = metrics._time(record, step)
+        except StopIteration:
+            break
+        rows += len(item) if isinstance(item, list) else 1
+        yield item
+    finish(rows)
@@ -0,0 +1,211 @@
+import argparse
+import csv
+import json
+import sys
+from typing import Iterable, List, Union
+from unitfier import Unitfier, NO_UOM, UOM_IN_KEY, UOM_IN_VALUE
+from data_reader_writer import DataReaderWriter
+
+_KIND_NAMES = {UOM_IN_KEY: "uom_in_key", UOM_IN_VALUE: "uom_in_value", NO_UOM: "no_uom"}
+
+
+# The state of one scan: the schema of the columns seen so far and the errors found. Each distinct header and each distinct unit of a column
+# is checked once.
+class _Scan:
+
+    def __init__(self, unitfier: Unitfier, target_units: Union[str, dict], max_errors: int):
+        self.unitfier = unitfier
+        self.target_units = target_units
+        self.max_errors = max_errors
+        self.columns = {}
+        self.errors = []
+        self.rows = None
+        self.complete = True
+        self._headers = {}
+        self._units = set()
+        self._dimensionalities = {}
+
+    # Whether max_errors errors have been found, after which the scan stops
+    @property
+    def full(self) -> bool:
+        return self.max_errors is not None and len(self.errors) >= self.max_errors
+
+    def add_error(self, row: int, column: str, unit, error: str):
+        self.errors.append({"row": row, "column": column, "unit": unit, "error": error})
+
+    # Checks a header (the keys of a row in file format) first seen at row. The method outputs the quantities whose UoM is in a separate
+    # column as a list of (name, key of the UoM column) tuples, whose units are then checked with add_unit.
+    def add_header(self, keys: tuple, row: int) -> List[tuple]:
+        value_units = self._headers.get(keys)
+        if value_units is not None:
+            return value_units
+
+        value_units = []
+        self._headers[keys] = value_units
+        plan, error, _ = self.unitfier._get_header_plan(keys)
+        if error is not None:
+            self.add_error(row, None, None, error)
+            return value_units
+
+        for kind, name, key, unit in plan:
+            column = self.columns.get(name)
+            if column is None:
+                column = self.columns[name] = {"kind": _KIND_NAMES[kind], "keys": [], "units": [], "dimensionality": None, "converted_units": None}
+            elif (kind == NO_UOM) != (column["kind"] == _KIND_NAMES[NO_UOM]):
+                self.add_error(row, name, None, f"Column '{name}' mixes values with and without UoM information.")
+            if key not in column["keys"]:
+                column["keys"].append(key)
+
+            if kind == UOM_IN_KEY:
+                self.add_unit(name, unit, row)
+            elif kind == UOM_IN_VALUE:
+                value_units.append((name, unit))
+        return value_units
+
+    # Checks a unit of a column, first seen at row: the unit has to be given, be known to the unit registry, have the dimensionality of the
+    # first unit of the column and be convertible to the target of the column (see Unitfier._resolve_target).
+    def add_unit(self, name: str, unit, row: int):
+        if (name, unit) in self._units:
+            return
+        self._units.add((name, unit))
+
+        if unit is None or unit != unit:
+            self.add_error(row, name, None, f"Column '{name}' has a value without a unit.")
+            return
+
+        column = self.columns[name]
+        unit = str(unit)
+        try:
+            target = self.unitfier._resolve_column_target(name, self.target_units, column["units"][0] if column["units"] else unit)
+            units, converted_units, _, _ = self.unitfier._get_unit_conversion(unit, target)
+        except Exception as e:
+            # Pint raises a range of errors for unit strings it can not parse (e.g. UndefinedUnitError, DefinitionSyntaxError, TokenError)
+            self.add_error(row, name, unit, f"Unit '{unit}' of column '{name}' is not valid: {type(e).__name__}: {e}")
+            return
+
+        dimensionality = units.dimensionality
+        if name not in self._dimensionalities:
+            self._dimensionalities[name] = dimensionality
+            column["dimensionality"] = self.unitfier._format_dimensionality(units)
+            column["converted_units"] = str(converted_units)
+        elif dimensionality != self._dimensionalities[name]:
+            self.add_error(row, name, unit, f"Unit '{unit}' of column '{name}' has another dimensionality than '{column['units'][0]}'.")
+            return
+        column["units"].append(unit)
+
+    def report(self) -> dict:
+        return {"rows": self.rows, "complete": self.complete, "columns": self.columns, "errors": self.errors}
+
+
+class SchemaScanner:
+
+    # The constructor takes the Unitfier whose separators/suffix the data uses, the target units the data will be converted to (see
+    # Unitfier.make_file_format_to_code_format), which are checked too, and the number of errors after which a scan stops (None to scan all data).
+    def __init__(self, unitfier: Unitfier = None, target_units: Union[str, dict] = None, max_errors: int = None):
+        self.unitfier = unitfier if unitfier is not None else Unitfier()
+        self.target_units = target_units
+        self.max_errors = max_errors
+
+    # A method that scans data in file format without converting it: the headers are checked (e.g. for a key with the separator more than
+    # ones) and each distinct unit of each column is parsed once, without making Pint quantities. The method takes an iterable of dictionaries
+    # (e.g. DataReaderWriter.iter_json) and outputs a report: a dictionary with the number of rows scanned, whether all rows were scanned
+    # (complete, False when the scan stopped at max_errors), the schema of the columns (their kind, keys, distinct units, dimensionality and
+    # the unit they are converted to) and a list of errors, each a dictionary with the row (index) and column it was first seen in, the unit
+    # and a message.
+    def scan(self, data: Iterable[dict]) -> dict:
+        scan = _Scan(self.unitfier, self.target_units, self.max_errors)
+        scan.rows = 0
+        keys, value_units = None, None
+        for row, obj in enumerate(data):
+            if scan.full:
+                scan.complete = False
+                break
+            if keys is None or len(obj) != len(keys) or tuple(obj) != keys:
+                keys = tuple(obj)
+                value_units = scan.add_header(keys, row)
+            for name, unit_key in value_units:
+                scan.add_unit(name, obj[unit_key], row)
+            scan.rows += 1
+        return scan.report()
+
+    # A method that scans a source (see DataReaderWriter.iter_source), see scan. Only the header and the UoM columns of a csv file are read,
+    # and the distinct units of a database table are selected by SQLite. The rows of a csv file or database table are not counted (rows is
+    # None) when it has no UoM columns.
+    def scan_source(self, source: Union[str, tuple], chunksize: int = 100000) -> dict:
+        kind, location = DataReaderWriter.resolve_location(source)
+        drw = DataReaderWriter(unitfier=self.unitfier)
+        try:
+            if kind == "database":
+                return self._scan_database_table(drw, *location)
+            if kind == "csv":
+                return self._scan_csv(location, chunksize)
+            return self.scan(drw.iter_source(location))
+        finally:
+            drw.close()
+
+    def _scan_csv(self, filename: str, chunksize: int) -> dict:
+        import pandas as pd
+
+        scan = _Scan(self.unitfier, self.target_units, self.max_errors)
+        with open(filename, newline="") as f:
+            header = tuple(next(csv.reader(f), ()))
+        value_units = scan.add_header(header, 0)
+        if not value_units:
+            return scan.report()
+
+        scan.rows = 0
+        usecols = list({unit_key for _, unit_key in value_units})
+        with pd.read_csv(filename, usecols=usecols, dtype=str, chunksize=chunksize) as reader:
+            for df in reader:
+                if scan.full:
+                    scan.complete = False
+                    break
+                for name, unit_key in value_units:
+                    for row, unit in df[unit_key].drop_duplicates().items():
+                        scan.add_unit(name, None if pd.isna(unit) else unit, row)
+                scan.rows += len(df)
+        return scan.report()
+
+    def _scan_database_table(self, drw: DataReaderWriter, db: str, table: str) -> dict:
+        scan = _Scan(self.unitfier, self.target_units, self.max_errors)
+        connection = drw._get_connection(db)
+        cursor = connection.execute(drw._select_table(connection, table) + " limit 0")
+        value_units = scan.add_header(tuple(col[0] for col in cursor.description), 0)
+        cursor.close()
+        if not value_units:
+            return scan.report()
+
+        quoted_table = drw._quote_identifier(table)
+        scan.rows = connection.execute("select count(*) from " + quoted_table).fetchone()[0]
+        for name, unit_key in value_units:
+            if scan.full:
+                scan.complete = False
+                break
+            # The distinct units of the column and the index of the first row of each, in the order the rows are read
+            column = drw._quote_identifier(unit_key)
+            query = (f"select unit, min(row) from (select {column} as unit, row_number() over (order by rowid) - 1 as row from {quoted_table}) "
+                     "group by unit order by min(row)")
+            for unit, row in connection.execute(query):
+                scan.add_unit(name, unit, row)
+        return scan.report()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the headers and units of data in file format without converting it, and print the "
+                                                 "schema and the errors found as json. Exits with status 1 if there are errors.")
+    parser.add_argument("source", help="csv, json, jsonl or xml file, dataset folder, or 'database::table'")
+    parser.add_argument("--max-errors", type=int, help="stop the scan after this many errors")
+    parser.add_argument("--target-units", help="unit system (e.g. 'imperial') or json object of column units to check the conversion to")
+    parser.add_argument("--suffix", default="_uom", help="UoM suffix")
+    parser.add_argument("--separator-start", default="_uom_", help="UoM start separator")
+    parser.add_argument("--separator-end", default="", help="UoM end separator")
+    args = parser.parse_args()
+
+    target_units = args.target_units
+    if target_units is not None and target_units.startswith("{"):
+        target_units = json.loads(target_units)
+    scanner = SchemaScanner(Unitfier(args.suffix, args.separator_start, args.separator_end), target_units, args.max_errors)
+    report = scanner.scan_source(args.source)
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    sys.exit(1 if report["errors"] else 0)
@@ -0,0 +1,101 @@
+import argparse
+from typing import Iterable, Iterator, Union
+from unitfier import Unitfier, LRUCache, NO_UOM, UOM_IN_VALUE
+from data_reader_writer import DataReaderWriter
+
+
+class Transcoder:
+
+    # The constructor takes the Unitfier whose separators/suffix the source data uses and the Unitfier whose separators/suffix the target data
+    # should use (the source Unitfier by default). It also takes the maximum number of column rewrites (one per distinct column and unit) to
+    # keep cached.
+    def __init__(self, source_unitfier: Unitfier = None, target_unitfier: Unitfier = None, rewrite_cache_size: int = 1024):
+        self.source_unitfier = source_unitfier if source_unitfier is not None else Unitfier()
+        self.target_unitfier = target_unitfier if target_unitfier is not None else self.source_unitfier
+        self._rewrites = LRUCache(rewrite_cache_size)
+
+    # A method that outputs the (cached) rewrite of a quantity column with a unit string, as a tuple (value_key, unit_key, unit_string, multiplier,
+    # offset, pint_unit) of the target key(s), the target unit string and the multiplier and offset that take a magnitude to the target unit.
+    # For units that can only be converted by Pint (e.g. logarithmic units) pint_unit is the unit string.
+    def _get_rewrite(self, name: str, unit: str, uom_in_key: bool, uom_abbreviated: bool, base_units: bool) -> tuple:
+        cache_key = (name, unit, uom_in_key, uom_abbreviated, base_units)
+        rewrite = self._rewrites.get(cache_key)
+        if rewrite is None:
+            units, target_units, multiplier, offset = self.source_unitfier._get_unit_conversion(unit)
+            pint_unit = None
+            if not base_units:
+                target_units, multiplier, offset = units, 1.0, 0.0
+            elif multiplier is None:
+                pint_unit = unit
+
+            unit_string = self.target_unitfier._format_units(target_units, uom_abbreviated)
+            value_key, unit_key = self.target_unitfier._get_file_format_keys(name, unit_string, uom_in_key)
+            rewrite = (value_key, unit_key, unit_string, multiplier, offset, pint_unit)
+            self._rewrites.put(cache_key, rewrite)
+        return rewrite
+
+    # A method that transcodes data in file format from the layout of the source Unitfier to the layout of the target Unitfier, one dictionary at
+    # a time, without making Pint quantities. The method takes an iterable of dictionaries (e.g. DataReaderWriter.iter_csv), whether the target
+    # should have the UoM in the key (uom_in_key = True) or in a suffix column, whether units should be abbreviated, and whether magnitudes should
+    # be rescaled to base units (base_units = True) or kept in their unit. Units are parsed and the target keys made once per column and unit
+    # (see _get_rewrite). A key with the separator more than ones raises a ValueError. The method yields the dictionaries in the target file format.
+    def iter_transcode(self, data: Iterable[dict], uom_in_key: bool = False, uom_abbreviated: bool = False, base_units: bool = False) -> Iterator[dict]:
+        source = self.source_unitfier
+        for obj in data:
+            plan, error, _ = source._get_header_plan(obj)
+            if error is not None:
+                raise ValueError(error)
+
+            new_dict = {}
+            for kind, name, key, unit in plan:
+                value = obj[key]
+                if kind == NO_UOM:
+                    new_dict[name] = value
+                    continue
+
+                if kind == UOM_IN_VALUE:
+                    unit = str(obj[unit])
+                value_key, unit_key, unit_string, multiplier, offset, pint_unit = self._get_rewrite(name, unit, uom_in_key, uom_abbreviated, base_units)
+                if value is None:
+                    pass
+                elif pint_unit is not None:
+                    value = source._to_base_magnitude(value, pint_unit)[0]
+                elif isinstance(value, str) or multiplier != 1.0 or offset:
+                    value = float(value) * multiplier + offset
+                new_dict[value_key] = value
+                if unit_key is not None:
+                    new_dict[unit_key] = unit_string
+            yield new_dict
+
+    # A method that transcodes a source to a target, streaming the rows from the reader to the writer of DataReaderWriter (see iter_transcode).
+    # The source is a source of DataReaderWriter.iter_source and the target a target of DataReaderWriter.write_target.
+    def transcode(self, source: Union[str, tuple], target: str, uom_in_key: bool = False, uom_abbreviated: bool = False, base_units: bool = False) -> str:
+        drw = DataReaderWriter(unitfier=self.source_unitfier)
+        try:
+            drw.write_target(self.iter_transcode(drw.iter_source(source), uom_in_key, uom_abbreviated, base_units), target)
+        finally:
+            drw.close()
+        return target
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transcode data in file format from one layout/format to another, e.g. a csv file with UoM "
+                                                 "suffix columns to a json file with the UoM in the keys.")
+    parser.add_argument("source", help="csv, json, jsonl or xml file, dataset folder, or 'database::table'")
+    parser.add_argument("target", help="csv, json, jsonl or xml file, dataset folder, or 'database::table'")
+    parser.add_argument("--uom-in-key", action="store_true", help="put the UoM in the keys of the target (in suffix columns otherwise)")
+    parser.add_argument("--abbreviated", action="store_true", help="abbreviate the units of the target")
+    parser.add_argument("--base-units", action="store_true", help="rescale the magnitudes to base units")
+    parser.add_argument("--suffix", default="_uom", help="UoM suffix of the source")
+    parser.add_argument("--separator-start", default="_uom_", help="UoM start separator of the source")
+    parser.add_argument("--separator-end", default="", help="UoM end separator of the source")
+    parser.add_argument("--target-suffix", help="UoM suffix of the target (that of the source by default)")
+    parser.add_argument("--target-separator-start", help="UoM start separator of the target (that of the source by default)")
+    parser.add_argument("--target-separator-end", help="UoM end separator of the target (that of the source by default)")
+    args = parser.parse_args()
+
+    source_unitfier = Unitfier(args.suffix, args.separator_start, args.separator_end)
+    target_unitfier = Unitfier(args.target_suffix if args.target_suffix is not None else args.suffix,
+                               args.target_separator_start if args.target_separator_start is not None else args.separator_start,
+                               args.target_separator_end if args.target_separator_end is not None else args.separator_end)
+    Transcoder(source_unitfier, target_unitfier).transcode(args.source, args.target, args.uom_in_key, args.abbreviated, args.base_units)
@@ -0,0 +1,188 @@
+from __future__ import annotations
+import math
+from array import array
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, Iterable, Iterator, List
+
+# Pint (UoM lib) and NumPy are slow to import, so they are imported on first use
+if TYPE_CHECKING:
+    import pint
+
+
+# A compact table of data in “code format”. The table holds a schema shared by all rows (the column names and, for quantity columns, the
+# unit) and one column of storage per name: an array of float magnitudes (8 bytes per value, NaN where a row lacks the quantity) for quantity
+# columns and a list of the values, with a bytearray that flags the rows lacking the column, for columns without UoM information. Rows are read through UnitTableRow views, which make a Pint quantity only when a value is accessed.
+# A table is made with Unitfier.make_file_format_to_unit_table or from a list of dictionaries in code format (from_dicts), and can be given
+# directly to Unitfier.make_code_format_to_file_format and the create_* writers of DataReaderWriter.
+class UnitTable:
+    __slots__ = ("names", "units", "columns", "missing", "unit_registry", "_positions", "_length", "_quantity")
+
+    # The constructor takes the unit registry that quantities are made with (taken from the first quantity appended if not given).
+    def __init__(self, unit_registry: pint.UnitRegistry = None):
+        self.names = []
+        self.units = []  # Pint unit of each quantity column, None for columns without UoM information
+        self.columns = []
+        self.missing = []  # Per column, a bytearray with 1 for each row that lacks the column (None for quantity columns, which hold NaN)
+        self.unit_registry = unit_registry
+        self._positions = {}
+        self._length = 0
+        self._quantity = None
+
+    # A class method that makes a table from a list of dictionaries in code format. The values of a quantity column are stored in the unit
+    # of the first quantity of the column.
+    @classmethod
+    def from_dicts(cls, data: Iterable[dict], unit_registry: pint.UnitRegistry = None) -> UnitTable:
+        table = cls(unit_registry)
+        for obj in data:
+            table.append(obj)
+        return table
+
+    # A method that outputs the rows of the table as a list of dictionaries in code format.
+    def to_dicts(self) -> List[dict]:
+        return [dict(row) for row in self]
+
+    # A method that outputs the table as columnar data (see Unitfier.make_file_format_to_code_format_columnar): a Pint quantity holding an
+    # array of magnitudes (NaN where a row lacks the column) per quantity column, and a list (None where a row lacks the column) per other column.
+    def to_columnar(self) -> dict:
+        return {name: self._column_data(position) for position, name in enumerate(self.names)}
+
+    # A method that adds a dictionary in code format to the table. A quantity is converted to the unit of its column; a column can not
+    # mix quantities and values without UoM information. A quantity with a NaN magnitude is stored as a missing value.
+    def append(self, obj: dict):
+        import pint
+
+        items = []
+        for name, value in obj.items():
+            if isinstance(value, pint.Quantity):
+                if self.unit_registry is None:
+                    self.unit_registry = value._REGISTRY
+                position = self._positions.get(name)
+                units = value.units if position is None or self.units[position] is None else self.units[position]
+                items.append((name, value.m_as(units), units))
+            else:
+                items.append((name, value, None))
+        self._append(items)
+
+    # Adds a row given as a list of (name, magnitude, unit) tuples, where the unit is None for values without UoM information and the
+    # magnitude of a quantity is in the unit of its column. Columns are added when a name is first seen, and columns the row lacks are padded.
+    def _append(self, items: list):
+        i = self._length
+        for name, value, units in items:
+            position = self._positions.get(name)
+            if position is None:
+                position = self._add_column(name, units)
+            elif (units is None) != (self.units[position] is None):
+                raise ValueError(f"Column '{name}' mixes values with and without UoM information.")
+            elif units is not None and units is not self.units[position] and units != self.units[position]:
+                import pint
+                raise pint.errors.DimensionalityError(self.units[position], units)
+
+            column = self.columns[position]
+            missing = self.missing[position]
+            if units is not None:
+                value = float(value)
+            if len(column) > i:
+                column[i] = value
+            else:
+                column.append(value)
+                if missing is not None:
+                    missing.append(0)
+
+        for position, column in enumerate(self.columns):
+            if len(column) == i:
+                missing = self.missing[position]
+                if missing is None:
+                    column.append(math.nan)
+                else:
+                    column.append(None)
+                    missing.append(1)
+        self._length += 1
+
+    def _add_column(self, name: str, units) -> int:
+        position = len(self.names)
+        self._positions[name] = position
+        self.names.append(name)
+        self.units.append(units)
+        if units is None:
+            self.columns.append([None] * self._length)
+            self.missing.append(bytearray(b"\x01") * self._length)
+        else:
+            self.columns.append(array("d", [math.nan]) * self._length)
+            self.missing.append(None)
+        return position
+
+    # A method that outputs one column of the table as columnar data (see to_columnar).
+    def column(self, name: str):
+        return self._column_data(self._positions[name])
+
+    def _column_data(self, position: int):
+        import numpy as np
+
+        if self.units[position] is None:
+            return [None if missing else value for value, missing in zip(self.columns[position], self.missing[position])]
+        return self._quantity_class()(np.array(self.columns[position], dtype=float), self.units[position])
+
+    # The class that quantities of the table are made with (see unitfier.get_quantity_class)
+    def _quantity_class(self) -> type:
+        if self._quantity is None:
+            from unitfier import get_quantity_class
+            self._quantity = get_quantity_class(self.unit_registry)
+        return self._quantity
+
+    # Whether the row at index has a value in the column at position
+    def _has_value(self, position: int, index: int) -> bool:
+        missing = self.missing[position]
+        if missing is None:
+            value = self.columns[position][index]
+            return value == value
+        return not missing[index]
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: int) -> UnitTableRow:
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("UnitTable index out of range")
+        return UnitTableRow(self, index)
+
+    def __iter__(self) -> Iterator[UnitTableRow]:
+        for index in range(self._length):
+            yield UnitTableRow(self, index)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(rows={self._length}, columns={list(zip(self.names, map(str, self.units)))})"
+
+
+# A read-only view of one row of a UnitTable, used like a dictionary in code format. A quantity is made from the stored magnitude and the
+# unit of its column when it is accessed.
+class UnitTableRow(Mapping):
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table: UnitTable, index: int):
+        self._table = table
+        self._index = index
+
+    def __getitem__(self, name):
+        table = self._table
+        position = table._positions[name]
+        if not table._has_value(position, self._index):
+            raise KeyError(name)
+        value = table.columns[position][self._index]
+        units = table.units[position]
+        return value if units is None else table._quantity_class()(value, units)
+
+    def __contains__(self, name) -> bool:
+        position = self._table._positions.get(name)
+        return position is not None and self._table._has_value(position, self._index)
+
+    def __iter__(self):
+        table = self._table
+        return (name for position, name in enumerate(table.names) if table._has_value(position, self._index))
+
+    def __len__(self) -> int:
+        return sum(1 for position in range(len(self._table.names)) if self._table._has_value(position, self._index))
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self)!r})"
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import shutil
+from typing import List, Union
+from data_reader_writer import DataReaderWriter
+
+
+class UnitfiedCache:
+
+    # The constructor takes the folder to keep the cache in, the maximum size of the cache in bytes, and how a source is fingerprinted: by the
+    # modification time and size of its file ("stat") or by a hash of its content ("hash", which also catches files rewritten with the same
+    # time and size, but reads the whole file). It also takes the target units to convert to (see Unitfier.make_file_format_to_code_format)
+    # and the DataReaderWriter to read the sources with, whose Unitfier separators/suffix are part of the key of each entry.
+    def __init__(self, folder: str, max_bytes: int = 1024 ** 3, fingerprint: str = "stat", target_units: Union[str, dict] = None,
+                 reader_writer: DataReaderWriter = None):
+        if fingerprint not in ("stat", "hash"):
+            raise ValueError(f"Fingerprint '{fingerprint}' is not one of 'stat' and 'hash'.")
+
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.fingerprint = fingerprint
+        self.target_units = target_units
+        self.reader_writer = reader_writer if reader_writer is not None else DataReaderWriter()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(folder, exist_ok=True)
+
+    # Outputs the source as a filename or a (database, table) tuple, as read by the readers of DataReaderWriter
+    @staticmethod
+    def _normalize_source(source: Union[str, tuple]) -> Union[str, tuple]:
+        kind, location = DataReaderWriter.resolve_location(source)
+        if kind == "database":
+            return (os.path.abspath(location[0]), location[1])
+        if kind == "npy":
+            raise ValueError(f"Source '{location}' is a dataset, which is not cached.")
+        return os.path.abspath(location)
+
+    # Outputs the folder holding the entries of a source, named by a hash of the source and the configuration it is unitfied with
+    def _source_folder(self, source: Union[str, tuple]) -> str:
+        u = self.reader_writer.unitfier
+        key = json.dumps([source, u.uom_suffix, u.uom_separator_start, u.uom_separator_end, self.target_units], sort_keys=True)
+        return os.path.join(self.folder, hashlib.sha256(key.encode()).hexdigest()[:32])
+
+    # Outputs the fingerprint of the file of a source (see the constructor). A database in WAL mode keeps committed writes in its -wal file
+    # until they are checkpointed, so the -wal file is part of the fingerprint of a database source.
+    def _get_fingerprint(self, source: Union[str, tuple]) -> str:
+        filenames = [source[0] if isinstance(source, tuple) else source]
+        if isinstance(source, tuple) and os.path.exists(filenames[0] + "-wal"):
+            filenames.append(filenames[0] + "-wal")
+
+        if self.fingerprint == "stat":
+            stats = [os.stat(filename) for filename in filenames]
+            return "-".join(f"{stat.st_mtime_ns}-{stat.st_size}" for stat in stats)
+
+        digest = hashlib.sha256()
+        for filename in filenames:
+            with open(filename, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+        return digest.hexdigest()[:32]
+
+    # A method that reads a source (the filename of a csv, json, jsonl or xml file, a "database::table" string or a (database, table) tuple)
+    # and makes it into columnar data in code format (see Unitfier.make_file_format_to_code_format_columnar). The result is stored in the
+    # cache as a dataset of .npy files (see DataReaderWriter.create_npy_dataset) and served from there, memory-mapped, while the fingerprint
+    # of the source stays the same. Storing an entry replaces older entries of the source and evicts the least recently used entries until
+    # the cache fits in max_bytes. The method outputs the columnar data as read by DataReaderWriter.read_npy_dataset, or False when the keys
+    # of the source are faulty.
+    def read(self, source: Union[str, tuple]) -> dict:
+        source = self._normalize_source(source)
+        source_folder = self._source_folder(source)
+        entry = os.path.join(source_folder, self._get_fingerprint(source))
+        drw = self.reader_writer
+
+        if os.path.exists(os.path.join(entry, "manifest.json")):
+            self.hits += 1
+            os.utime(entry)
+            return drw.read_npy_dataset(entry)
+
+        self.misses += 1
+        data = drw.unitfier.make_file_format_to_code_format_columnar(list(drw.iter_source(source)), self.target_units)
+        if data is False:
+            return False
+
+        # The dataset is written to a temporary folder and moved into place (see DataReaderWriter.create_npy_dataset), so an entry is either
+        # complete or missing
+        for name in os.listdir(source_folder) if os.path.isdir(source_folder) else []:
+            if not name.startswith("."):
+                shutil.rmtree(os.path.join(source_folder, name), ignore_errors=True)
+        drw.create_npy_dataset(data, entry)
+        self._evict(entry)
+        return drw.read_npy_dataset(entry)
+
+    # A method that reads a source like read, and outputs it as a list of dictionaries in code format, leaving out missing values.
+    def read_rows(self, source: Union[str, tuple]) -> List[dict]:
+        import numpy as np
+        import pint
+
+        data = self.read(source)
+        if data is False:
+            return False
+
+        rows = [{} for _ in range(max((len(values) for values in data.values()), default=0))]
+        Quantity = self.reader_writer.unitfier.Quantity
+        for name, values in data.items():
+            if isinstance(values, pint.Quantity):
+                units = values.units
+                for obj, magnitude in zip(rows, np.asarray(values.magnitude).tolist()):
+                    if magnitude == magnitude:
+                        obj[name] = Quantity(magnitude, units)
+            else:
+                for obj, value in zip(rows, values.tolist() if isinstance(values, np.ndarray) else values):
+                    if value is not None:
+                        obj[name] = value
+        return rows
+
+    # A method that removes the entries of a source from the cache, or all entries (source = None).
+    def invalidate(self, source: Union[str, tuple] = None):
+        if source is not None:
+            shutil.rmtree(self._source_folder(self._normalize_source(source)), ignore_errors=True)
+            return
+
+        for name in os.listdir(self.folder):
+            shutil.rmtree(os.path.join(self.folder, name), ignore_errors=True)
+
+    # Outputs the entries of the cache as a list of (path, size in bytes, time last used) tuples
+    def _entries(self) -> List[tuple]:
+        entries = []
+        for source_name in os.listdir(self.folder):
+            source_folder = os.path.join(self.folder, source_name)
+            if source_name.startswith(".") or not os.path.isdir(source_folder):
+                continue
+            for entry_name in os.listdir(source_folder):
+                entry = os.path.join(source_folder, entry_name)
+                if entry_name.startswith("."):
+                    # A dataset being written (see DataReaderWriter._replace_folder)
+                    continue
+                size = sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+                entries.append((entry, size, os.path.getmtime(entry)))
+        return entries
+
+    # Removes the least recently used entries, except keep, until the cache fits in max_bytes
+    def _evict(self, keep: str = None):
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        size = sum(entry[1] for entry in entries)
+        for entry, entry_size, _ in entries:
+            if size <= self.max_bytes:
+                break
+            if entry == keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            size -= entry_size
+
+    # A method that outputs the hit/miss statistics of the cache and its current size.
+    def info(self) -> dict:
+        entries = self._entries()
+        return {"hits": self.hits, "misses": self.misses, "entries": len(entries), "bytes": sum(entry[1] for entry in entries),
+                "max_bytes": self.max_bytes}
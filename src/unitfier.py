@@ -1,17 +1,376 @@
-from typing import List
-import pint  # UoM lib
+from __future__ import annotations
+import math
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Union
+from metrics import Metrics, instrumented
+from unit_table import UnitTable
+
+# Pint (UoM lib) and NumPy are slow to import, so they are imported on first use
+if TYPE_CHECKING:
+    import pint
+
+# Unit registries built from a cache folder, shared by all Unitfiers using the same folder
+_shared_unit_registries = {}
+
+
+# A function that outputs a shared Pint unit registry. The function takes the path to a cache folder as input, where Pint stores the parsed
+# unit definitions the first time so later processes can load them instead of parsing the definition files again. Without a cache folder
+# Pint's application registry (the one behind pint.Quantity) is output.
+def get_unit_registry(cache_folder: str = None) -> pint.UnitRegistry:
+    import pint
+
+    if cache_folder is None:
+        return pint.get_application_registry()
+
+    if cache_folder not in _shared_unit_registries:
+        _shared_unit_registries[cache_folder] = pint.UnitRegistry(cache_folder=cache_folder)
+    return _shared_unit_registries[cache_folder]
+
+
+# A function that outputs the class that quantities of a unit registry are made with: pint.Quantity for Pint's application registry (so
+# quantities keep the type of those made with pint.Quantity directly), and the Quantity class of the registry otherwise.
+def get_quantity_class(unit_registry: pint.UnitRegistry) -> type:
+    import pint
+
+    application_registry = pint.get_application_registry()
+    if unit_registry is application_registry or unit_registry is application_registry.get():
+        return pint.Quantity
+    return unit_registry.Quantity
+
+
+# Kinds of keys in a compiled header plan (see Unitfier._get_header_plan), also read by the Transcoder and the SchemaScanner
+UOM_IN_KEY = 0
+UOM_IN_VALUE = 1
+NO_UOM = 2
+
+
+# Kinds of target units a value can be converted to instead of base units (see Unitfier._resolve_target)
+_TARGET_UNIT = 0
+_TARGET_SYSTEM = 1
+_TARGET_KEEP = 2
+
+
+# A small least recently used cache with hit and miss counters, used by the Unitfier to remember work that is the same for many rows. The cache
+# can be used from several threads (e.g. by AsyncDataReaderWriter).
+class LRUCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    # A pickled cache (e.g. of a Unitfier sent to another process) keeps its size only, and is rebuilt empty with a lock of its own
+    def __getstate__(self) -> dict:
+        return {"maxsize": self.maxsize}
+
+    def __setstate__(self, state: dict):
+        self.__init__(state["maxsize"])
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "maxsize": self.maxsize, "currsize": len(self._data)}
+
+
+# A dictionary in “code format” that is backed by the raw dictionary in file format and the header index of its keys (see
+# Unitfier._compile_header_plan). A value is made into a Pint quantity (converted to base units) the first time it is accessed, and kept for
+# later accesses, so rows of which only a few keys are used cost only those conversions. Values can be set and deleted like in a dictionary.
+# Quantities are converted to target_units instead of base units, if given (see Unitfier._resolve_target).
+class LazyCodeFormatRow(MutableMapping):
+    __slots__ = ("_obj", "_index", "_unitfier", "_target_units", "_values", "_keys")
+
+    def __init__(self, obj: dict, index: dict, unitfier: Unitfier, target_units: Union[str, dict] = None):
+        self._obj = obj
+        self._index = index
+        self._unitfier = unitfier
+        self._target_units = target_units
+        self._values = {}
+        self._keys = None  # The keys, once they differ from the keys of the index
+
+    def __getitem__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+        if self._keys is not None and name not in self._keys:
+            raise KeyError(name)
+
+        kind, key, unit = self._index[name]
+        if kind == NO_UOM:
+            value = self._obj[key]
+        else:
+            if kind == UOM_IN_VALUE:
+                unit = str(self._obj[unit])
+            target = None if self._target_units is None else self._unitfier._resolve_target(name, self._target_units)
+            value = self._unitfier._to_base_units(self._obj[key], unit, target)
+        self._values[name] = value
+        return value
+
+    def __setitem__(self, name, value):
+        if name not in self:
+            self._own_keys().append(name)
+        self._values[name] = value
+
+    def __delitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        self._own_keys().remove(name)
+        self._values.pop(name, None)
+
+    def _own_keys(self) -> list:
+        if self._keys is None:
+            self._keys = list(self._index)
+        return self._keys
+
+    def __contains__(self, name) -> bool:
+        return name in (self._index if self._keys is None else self._keys)
+
+    def __iter__(self):
+        return iter(self._index if self._keys is None else self._keys)
+
+    def __len__(self) -> int:
+        return len(self._index if self._keys is None else self._keys)
+
+    # Makes every value, e.g. before the row is pickled or the file format dictionary is let go
+    def to_dict(self) -> dict:
+        return {name: self[name] for name in self}
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
 
 
 class Unitfier:
-    # The constructor takes variables to set the suffix and start/end separator.
-    def __init__(self, uom_in_value_suffix: str = "_uom", uom_in_key_separator_start: str = "_uom_", uom_in_key_separator_end: str = ""):
+    # The constructor takes variables to set the suffix and start/end separator. It also takes the maximum number of compiled header plans
+    # (one per distinct set of keys), of built file format keys, of unit conversions (one per distinct unit string) and of formatted unit and
+    # dimensionality strings to keep cached.
+    # The unit registry used to make quantities can be given directly, or be built from a cache folder (see get_unit_registry). The
+    # registry is not resolved until it is first needed. Calls of the conversion methods are recorded in metrics, if given.
+    def __init__(self, uom_in_value_suffix: str = "_uom", uom_in_key_separator_start: str = "_uom_", uom_in_key_separator_end: str = "",
+                 header_plan_cache_size: int = 128, file_format_key_cache_size: int = 1024, unit_cache_size: int = 256,
+                 unit_string_cache_size: int = 256, unit_registry: pint.UnitRegistry = None, unit_registry_cache_folder: str = None, metrics: Metrics = None):
+        self.metrics = metrics
         self.uom_suffix = uom_in_value_suffix
         self.uom_separator_start = uom_in_key_separator_start
         self.uom_separator_end = uom_in_key_separator_end
+        self._unit_registry = unit_registry
+        self._unit_registry_cache_folder = unit_registry_cache_folder
+        self._quantity_class = None
+        self._header_plans = LRUCache(header_plan_cache_size)
+        self._file_format_keys = LRUCache(file_format_key_cache_size)
+        self._unit_conversions = LRUCache(unit_cache_size)
+        self._unit_strings = LRUCache(unit_string_cache_size)
+        self._dimensionality_strings = LRUCache(unit_string_cache_size)
+
+    # The unit registry that the Unitfier makes quantities with.
+    @property
+    def unit_registry(self) -> pint.UnitRegistry:
+        if self._unit_registry is None:
+            self._unit_registry = get_unit_registry(self._unit_registry_cache_folder)
+        return self._unit_registry
+
+    # A Unitfier can be pickled, e.g. to run conversions in a ProcessPoolExecutor (see AsyncDataReaderWriter). Its caches are rebuilt empty
+    # and its unit registry is resolved again in the other process. A unit registry given directly (other than Pint's application registry)
+    # can not be pickled, so a Unitfier with one raises a TypeError; give unit_registry_cache_folder instead.
+    def __getstate__(self) -> dict:
+        import pint
+
+        registry = self._unit_registry
+        if (registry is not None and get_quantity_class(registry) is not pint.Quantity
+                and registry is not _shared_unit_registries.get(self._unit_registry_cache_folder)):
+            raise TypeError("A Unitfier with a unit registry given directly can not be pickled, give unit_registry_cache_folder instead.")
+        state = self.__dict__.copy()
+        state["_unit_registry"] = None
+        state["_quantity_class"] = None
+        return state
+
+    # The class that the Unitfier makes quantities with (see get_quantity_class).
+    @property
+    def Quantity(self) -> type:
+        if self._quantity_class is None:
+            self._quantity_class = get_quantity_class(self.unit_registry)
+        return self._quantity_class
+
+    # A method that outputs the hit/miss statistics of the caches used by the Unitfier.
+    def cache_info(self) -> dict:
+        return {"header_plans": self._header_plans.info(), "file_format_keys": self._file_format_keys.info(),
+                "units": self._unit_conversions.info(), "unit_strings": self._unit_strings.info(),
+                "dimensionality_strings": self._dimensionality_strings.info()}
+
+    # A method that outputs the target a column is converted to, from the target_units given to a conversion method. target_units can be None
+    # (base units), the name of a Pint unit system (e.g. "imperial" or "cgs", the base units of that system) or a dictionary that maps columns
+    # to a unit string, or to None to keep the unit of the file. Columns not in the dictionary are converted to base units. The target is None
+    # for base units or a tuple of its kind and the unit string or system name.
+    def _resolve_target(self, column: str, target_units: Union[str, dict]) -> tuple:
+        if target_units is None:
+            return None
+        if isinstance(target_units, str):
+            return (_TARGET_SYSTEM, target_units)
+        if column not in target_units:
+            return None
+        unit = target_units[column]
+        return (_TARGET_KEEP, None) if unit is None else (_TARGET_UNIT, str(unit))
+
+    # A method that outputs the target of a column that has to hold one unit (see make_file_format_to_code_format_columnar), where keeping the
+    # unit of the file means converting to the unit of the first value of the column (first_unit).
+    def _resolve_column_target(self, column: str, target_units: Union[str, dict], first_unit: str) -> tuple:
+        target = self._resolve_target(column, target_units)
+        if target is not None and target[0] == _TARGET_KEEP:
+            return (_TARGET_UNIT, first_unit)
+        return target
+
+    # A method that outputs the (cached) conversion of a unit string to base units, or to a target (see _resolve_target), as a tuple of the
+    # parsed unit, the base (or target) unit, and the multiplier and offset that take a magnitude from the unit to the base unit
+    # (base = value * multiplier + offset). For units that can not be converted that way (e.g. logarithmic units) the multiplier and offset
+    # are None. A target unit of another dimension raises a DimensionalityError.
+    def _get_unit_conversion(self, unit: str, target: tuple = None) -> tuple:
+        cache_key = unit if target is None else (unit, target)
+        conversion = self._unit_conversions.get(cache_key)
+        if conversion is None:
+            import pint
+
+            Quantity = self.Quantity
+            units = Quantity(1.0, unit).units
+            if target is None:
+                target_units = None
+            elif target[0] == _TARGET_SYSTEM:
+                # check_nonmult = False, as Pint would otherwise cache the base units of the system as those of the default system
+                target_units = self.unit_registry.get_base_units(units, False, target[1])[1]
+            elif target[0] == _TARGET_UNIT:
+                target_units = Quantity(1.0, target[1]).units
+            else:
+                target_units = units
+            convert = (lambda quantity: quantity.to_base_units()) if target is None else (lambda quantity: quantity.to(target_units))
+            zero = convert(Quantity(0.0, units))
+            try:
+                multiplier = convert(Quantity(1.0, units) - Quantity(0.0, units)).magnitude
+                offset = zero.magnitude
+                if not math.isclose(convert(Quantity(2.0, units)).magnitude, 2.0 * multiplier + offset):
+                    multiplier, offset = None, None
+            except pint.errors.PintError:
+                multiplier, offset = None, None
+            conversion = (units, zero.units, multiplier, offset)
+            self._unit_conversions.put(cache_key, conversion)
+        return conversion
+
+    # A method that converts a value with a unit string to base units, or to a target (see _resolve_target), using the cached unit conversion.
+    # The method outputs a tuple of the magnitude in base units and the base unit.
+    def _to_base_magnitude(self, value, unit: str, target: tuple = None) -> tuple:
+        units, base_units, multiplier, offset = self._get_unit_conversion(unit, target)
+        if multiplier is None:
+            quantity = self.Quantity(float(value), units)
+            quantity = quantity.to_base_units() if target is None else quantity.to(base_units)
+            return quantity.magnitude, quantity.units
+        if offset:
+            return float(value) * multiplier + offset, base_units
+        return float(value) * multiplier, base_units
+
+    # A method that makes a value and a unit string into a Pint quantity converted to base units, or to a target (see _resolve_target), using
+    # the cached unit conversion.
+    def _to_base_units(self, value, unit: str, target: tuple = None) -> pint.Quantity:
+        return self.Quantity(*self._to_base_magnitude(value, unit, target))
+
+    # A method that compiles a "header plan" for a tuple of keys in file format. The plan is a tuple with one entry (kind, name, key, unit)
+    # per key to keep, where kind tells whether the UoM is in the key (unit is the UoM), in a separate column (unit is the key of that column)
+    # or missing (unit is None). Keys with the UoM suffix are dropped. The method outputs the plan, an error message (or None) and an index
+    # that maps each name to its (kind, key, unit), used by LazyCodeFormatRow.
+    def _compile_header_plan(self, keys: tuple) -> tuple:
+        key_set = set(keys)
+        plan = []
+        for key in keys:
+
+            # If UoM information is in key
+            if self.uom_separator_start in key:
+                header_parts = key.split(self.uom_separator_start)
+
+                if len(header_parts) > 2:
+                    return None, f"Key/header '{key}' are not allowed to contain the separator sign '{self.uom_separator_start}' more than ones.", None
+
+                unit = str(header_parts[1])[0:len(header_parts[1])-len(self.uom_separator_end)]
+                plan.append((UOM_IN_KEY, header_parts[0], key, unit))
+
+            # If UoM information is in seperate column
+            elif (key+self.uom_suffix) in key_set:
+                plan.append((UOM_IN_VALUE, key, key, key+self.uom_suffix))
+
+            # If no UoM information (exclude keys containing UoM suffix)
+            elif not (len(key) > len(self.uom_suffix) and key[-len(self.uom_suffix):] == self.uom_suffix):
+                plan.append((NO_UOM, key, key, None))
+
+        return tuple(plan), None, {name: (kind, key, unit) for kind, name, key, unit in plan}
+
+    # A method that outputs the (cached) header plan, error message and index for a dictionary in file format, see _compile_header_plan.
+    def _get_header_plan(self, obj: dict) -> tuple:
+        keys = tuple(obj)
+        compiled = self._header_plans.get(keys)
+        if compiled is None:
+            compiled = self._compile_header_plan(keys)
+            self._header_plans.put(keys, compiled)
+        return compiled
+
+    # A method that outputs the unit of a Pint unit or quantity as a string in file format, in full or abbreviated form and without spaces. The
+    # strings are cached per unit (the units container Pint keeps on units and quantities, which is cheap to hash) and form.
+    def _format_units(self, units: Union[pint.Unit, pint.Quantity], uom_abbreviated: bool) -> str:
+        cache_key = (units._units, uom_abbreviated)
+        unit_string = self._unit_strings.get(cache_key)
+        if unit_string is None:
+            units = getattr(units, "units", units)
+            unit_string = ('{:~}'.format(units) if uom_abbreviated else str(units)).replace(' ', '')
+            self._unit_strings.put(cache_key, unit_string)
+        return unit_string
+
+    # A method that outputs the (cached) dimensionality of a Pint quantity as a string for keys, e.g. "length/time".
+    def _format_dimensionality(self, quantity: pint.Quantity) -> str:
+        dimensionality = quantity.dimensionality
+        dimensionality_string = self._dimensionality_strings.get(dimensionality)
+        if dimensionality_string is None:
+            dimensionality_string = str(dimensionality).replace('[', '').replace(']', '').replace(' ', '')
+            self._dimensionality_strings.put(dimensionality, dimensionality_string)
+        return dimensionality_string
+
+    # A method that outputs the (cached) keys that a value with a unit is written to in file format, as a tuple of the key for the
+    # magnitude and the key for the unit (None when the unit is put in the key).
+    def _get_file_format_keys(self, key: str, units: str, uom_in_key: bool) -> tuple:
+        cache_key = (key, units, uom_in_key)
+        file_format_keys = self._file_format_keys.get(cache_key)
+        if file_format_keys is None:
+            if uom_in_key:
+                file_format_keys = (key+self.uom_separator_start+units+self.uom_separator_end, None)
+            else:
+                file_format_keys = (key, key+self.uom_suffix)
+            self._file_format_keys.put(cache_key, file_format_keys)
+        return file_format_keys
     
     # A method that adds separators or suffixes, with a unit of measurement placeholder value (x), to all elements in a list of dictionaries. 
     # The method takes a list of dictionaries, to add the placeholders too, as input and a boolean for whether separators (uom_in_key = True) 
     # or suffixes (uom_in_key = False) should be added. The method outputs a list of dictionaries with placeholders added.
+    @instrumented
     def add_uom_placeholder(self, data: List[dict], uom_in_key: bool = False) -> List[dict]:
         new_data = []
         for dict in data:
@@ -25,87 +384,467 @@ class Unitfier:
             new_data.append(new_dict)
         return new_data
     
-    # A method that makes data in “code format” into “file format”. The method takes a list of dictionaries as input, containing the data that
+    # A method that makes data in “code format” into “file format”. The method takes a list of dictionaries (or a UnitTable) as input, containing the data that
     # is to be converted. The method takes a boolean for whether the file format data should use separators (uom_in_key = True) or suffixes 
     # (uom_in_key = False). The method takes an input for whether the unit of measurement names should be given in full or abbreviated form. 
     # The method outputs a list of dictionaries with data in file format.
-    def make_code_format_to_file_format(self, data: List[dict], uom_in_key: bool = False, uom_abbreviated: bool = False) -> List[dict]:
-        new_data = []
+    @instrumented
+    def make_code_format_to_file_format(self, data: Union[List[dict], UnitTable], uom_in_key: bool = False, uom_abbreviated: bool = False) -> List[dict]:
+        return list(self.iter_code_format_to_file_format(data, uom_in_key, uom_abbreviated))
+
+    # A method that makes data in “code format” into “file format” one dictionary at a time. The method takes an iterable of dictionaries as input
+    # (e.g. from iter_file_format_to_code_format) and the same options as make_code_format_to_file_format, and yields the dictionaries in
+    # file format, so they can be passed on to the streaming writers of DataReaderWriter. A UnitTable is read from its columns directly.
+    @instrumented
+    def iter_code_format_to_file_format(self, data: Union[Iterable[dict], UnitTable], uom_in_key: bool = False, uom_abbreviated: bool = False) -> Iterator[dict]:
+        import pint
+
+        if isinstance(data, UnitTable):
+            yield from self._iter_unit_table_to_file_format(data, uom_in_key, uom_abbreviated)
+            return
 
         for dict in data:
             new_dict = {}
             for key in dict:
-                if type(dict[key]) == pint.Quantity:
-                    units = str(dict[key].units).replace(' ', '')
-                    if uom_abbreviated:
-                        units = '{:~}'.format(dict[key].units).replace(' ', '')
-
-                    if uom_in_key:
-                        new_dict[key+self.uom_separator_start+units] = dict[key].magnitude
-                    else:
-                        new_dict[key] = dict[key].magnitude
-                        new_dict[key+self.uom_suffix] = units
+                if isinstance(dict[key], pint.Quantity):
+                    units = self._format_units(dict[key], uom_abbreviated)
+
+                    value_key, unit_key = self._get_file_format_keys(key, units, uom_in_key)
+                    new_dict[value_key] = dict[key].magnitude
+                    if unit_key is not None:
+                        new_dict[unit_key] = units
                 else:
                     new_dict[key] = dict[key]
-            new_data.append(new_dict)
-
-        return new_data
+            yield new_dict
     
+    # Yields the rows of a UnitTable in file format. The unit string and file format keys of each column are made once, and the magnitudes are
+    # read from the column storage without making Pint quantities.
+    def _iter_unit_table_to_file_format(self, table: UnitTable, uom_in_key: bool, uom_abbreviated: bool) -> Iterator[dict]:
+        columns = []
+        for name, units, values, missing in zip(table.names, table.units, table.columns, table.missing):
+            if units is None:
+                columns.append((name, None, None, values, missing))
+                continue
+            unit_string = self._format_units(units, uom_abbreviated)
+            value_key, unit_key = self._get_file_format_keys(name, unit_string, uom_in_key)
+            columns.append((value_key, unit_key, unit_string, values, missing))
+
+        for i in range(len(table)):
+            new_dict = {}
+            for value_key, unit_key, unit_string, values, missing in columns:
+                value = values[i]
+                if (missing[i] if missing is not None else value != value):
+                    continue
+                new_dict[value_key] = value
+                if unit_key is not None:
+                    new_dict[unit_key] = unit_string
+            yield new_dict
+
     # A method that makes a list of Pint quantities into data in file format. The method takes a list of Pint quantities as input. The method takes a boolean
     # for whether the file format data should use separators (uom_in_key = True) or suffixes (uom_in_key = False). The method takes an input for whether the 
     # unit of measurement names should be given in full or abbreviated form. The method outputs a dictionary of data in file format.
+    @instrumented
     def make_pint_quantities_to_file_format(self, quantities: List[pint.Quantity], uom_in_key: bool = False, uom_abbreviated: bool = False) -> List[dict]:
         new_dict = {}
         for i, quant in enumerate(quantities):
-            key = "id" + str(i) + "_" + str(quant.dimensionality).replace('[', '').replace(']', '').replace(' ', '')
-            units = str(quant.units).replace(' ', '')
-            if uom_abbreviated:
-                units = '{:~}'.format(quant.units).replace(' ', '')
+            key = "id" + str(i) + "_" + self._format_dimensionality(quant)
+            units = self._format_units(quant, uom_abbreviated)
 
             if uom_in_key:
-                new_dict[key+self.uom_separator_start+units] = quant.magnitude
+                new_dict[key+self.uom_separator_start+units+self.uom_separator_end] = quant.magnitude
             else:
                 new_dict[key] = quant.magnitude
                 new_dict[key+self.uom_suffix] = units
 
         return [new_dict]
 
+    # A method that makes columnar data in “code format” (e.g. from make_file_format_to_code_format_columnar, UnitTable.to_columnar or
+    # DataReaderWriter.read_npy_dataset) into “file format”, with the same options as make_code_format_to_file_format. The unit of each quantity
+    # column is formatted, and its file format keys made, once for the whole column. Missing values (NaN in quantity columns, None in other
+    # columns) are left out of the rows. The method outputs a list of dictionaries with data in file format.
+    @instrumented
+    def make_code_format_columnar_to_file_format(self, data: dict, uom_in_key: bool = False, uom_abbreviated: bool = False) -> List[dict]:
+        import numpy as np
+        import pint
+
+        rows = [{} for _ in range(max((len(values) for values in data.values()), default=0))]
+        for name, values in data.items():
+            if isinstance(values, pint.Quantity):
+                units = self._format_units(values, uom_abbreviated)
+                value_key, unit_key = self._get_file_format_keys(name, units, uom_in_key)
+                magnitudes = np.asarray(values.magnitude, dtype=float)
+                present = (~np.isnan(magnitudes)).tolist()
+                for new_dict, magnitude, is_present in zip(rows, magnitudes.tolist(), present):
+                    if is_present:
+                        new_dict[value_key] = magnitude
+                        if unit_key is not None:
+                            new_dict[unit_key] = units
+            else:
+                values = values.tolist() if isinstance(values, np.ndarray) else values
+                for new_dict, value in zip(rows, values):
+                    if value is not None:
+                        new_dict[name] = value
+        return rows
+
     # A method that makes data in “file format” into “code format”. The method takes a list of dictionaries as input, containing the data that is to be converted. 
-    # The method outputs a list of dictionaries with data in code format.
-    def make_file_format_to_code_format(self, data: List[dict]) -> List[dict]:
+    # With lazy = True the dictionaries are LazyCodeFormatRows, which make each quantity the first time it is accessed instead of all at once.
+    # Quantities are converted to base units, or to target_units if given: the name of a Pint unit system, or a dictionary that maps columns to
+    # a unit string, or to None to keep the unit of the file (see _resolve_target). The method outputs a list of dictionaries with data in code format.
+    @instrumented
+    def make_file_format_to_code_format(self, data: List[dict], lazy: bool = False, target_units: Union[str, dict] = None) -> List[dict]:
         data_unitfied = []
 
         for obj in data:
-            temp_obj = {}
-
-            for key in obj:
-                
-                # If UoM information is in key:
-                # Make unit value (converted to base eg. mm -> m)
-                if self.uom_separator_start in key:
-                    header_parts = key.split(self.uom_separator_start)
-                    
-                    if len(header_parts) > 2: 
-                        print(f"Error: Key/header '{key}' are not allowed to contain the separator sign '{self.uom_separator_start}' more than ones.") 
-                        return False
-
-                    temp_obj[header_parts[0]] = pint.Quantity(float(obj[key]), str(header_parts[1])[0:len(header_parts[1])-len(self.uom_separator_end)]).to_base_units()
-
-                # If UoM information is in seperate column:
-                # Make unit value (converted to base eg. mm -> m)
-                elif (key+self.uom_suffix) in obj:
-                    temp_obj[key] = pint.Quantity(
-                        float(obj[key]), str(obj[key+self.uom_suffix])).to_base_units()
-
-                # If no UoM information:
-                # Make unitliess value
+            plan, error, index = self._get_header_plan(obj)
+            if error is not None:
+                print(f"Error: {error}")
+                return False
+
+            if lazy:
+                data_unitfied.append(LazyCodeFormatRow(obj, index, self, target_units))
+            else:
+                data_unitfied.append(self._make_obj_code_format(obj, plan, target_units))
+        return data_unitfied
+
+    # A method that makes data in “file format” into “code format” one dictionary at a time. The method takes an iterable of dictionaries as input
+    # (e.g. DataReaderWriter.iter_csv) and yields the dictionaries in code format, so data larger than the memory can be converted. A key with
+    # the separator more than ones raises a ValueError. With lazy = True LazyCodeFormatRows are yielded, and quantities are converted to
+    # target_units if given (see make_file_format_to_code_format).
+    @instrumented
+    def iter_file_format_to_code_format(self, data: Iterable[dict], lazy: bool = False, target_units: Union[str, dict] = None) -> Iterator[dict]:
+        for obj in data:
+            plan, error, index = self._get_header_plan(obj)
+            if error is not None:
+                raise ValueError(error)
+
+            if lazy:
+                yield LazyCodeFormatRow(obj, index, self, target_units)
+            else:
+                yield self._make_obj_code_format(obj, plan, target_units)
+
+    # A method that makes one dictionary in file format into code format, following the compiled header plan of its keys. Quantities are
+    # converted to target_units, if given (see _resolve_target).
+    def _make_obj_code_format(self, obj: dict, plan: tuple, target_units: Union[str, dict] = None) -> dict:
+        temp_obj = {}
+        for kind, name, key, unit in plan:
+            target = None if target_units is None or kind == NO_UOM else self._resolve_target(name, target_units)
+
+            # If UoM information is in key:
+            # Make unit value (converted to base eg. mm -> m)
+            if kind == UOM_IN_KEY:
+                temp_obj[name] = self._to_base_units(obj[key], unit, target)
+
+            # If UoM information is in seperate column:
+            # Make unit value (converted to base eg. mm -> m)
+            elif kind == UOM_IN_VALUE:
+                temp_obj[name] = self._to_base_units(obj[key], str(obj[unit]), target)
+
+            # If no UoM information:
+            # Make unitliess value
+            else:
+                temp_obj[name] = obj[key]
+
+        return temp_obj
+
+    # A method that makes data in “file format” into a UnitTable, a compact table of data in code format that stores the magnitudes of each
+    # quantity column, in base units, in an array (see unit_table.py). The method takes an iterable of dictionaries as input (e.g.
+    # DataReaderWriter.iter_csv), so the whole file format data does not have to be in memory. A key with the separator more than ones raises a
+    # ValueError, and a column with quantities of different dimensions a DimensionalityError. Quantities are converted to target_units, if
+    # given (see make_file_format_to_code_format); a column whose unit is kept is stored in the unit of its first value.
+    @instrumented
+    def make_file_format_to_unit_table(self, data: Iterable[dict], target_units: Union[str, dict] = None) -> UnitTable:
+        table = UnitTable(self.unit_registry)
+        targets = {}
+        for obj in data:
+            plan, error, _ = self._get_header_plan(obj)
+            if error is not None:
+                raise ValueError(error)
+
+            items = []
+            for kind, name, key, unit in plan:
+                if kind == NO_UOM:
+                    items.append((name, obj[key], None))
+                    continue
+                if kind == UOM_IN_VALUE:
+                    unit = str(obj[unit])
+                target = None
+                if target_units is not None:
+                    if name not in targets:
+                        targets[name] = self._resolve_column_target(name, target_units, unit)
+                    target = targets[name]
+                magnitude, base_units = self._to_base_magnitude(obj[key], unit, target)
+                items.append((name, magnitude, base_units))
+            table._append(items)
+        return table
+
+    # A method that makes the quantities of one dictionary in file format into magnitudes in base units, without making Pint quantities. The
+    # method outputs a dictionary that maps the name of each quantity to a tuple of its magnitude and base unit. Keys without UoM information
+    # are left out. A key with the separator more than ones raises a ValueError.
+    def make_obj_base_magnitudes(self, obj: dict) -> dict:
+        plan, error, _ = self._get_header_plan(obj)
+        if error is not None:
+            raise ValueError(error)
+
+        magnitudes = {}
+        for kind, name, key, unit in plan:
+            if kind == UOM_IN_KEY:
+                magnitudes[name] = self._to_base_magnitude(obj[key], unit)
+            elif kind == UOM_IN_VALUE:
+                magnitudes[name] = self._to_base_magnitude(obj[key], str(obj[unit]))
+        return magnitudes
+
+    # A method that makes data in “file format” into blocks of plain values, which are cheap to pickle (e.g. to send them between processes),
+    # without making Pint quantities. Consecutive dictionaries with the same names and base units share a block: a tuple of the names, the base
+    # unit strings (None for values without UoM information) and a list with a tuple of values per dictionary (magnitudes in base units for
+    # quantities). A key with the separator more than ones raises a ValueError.
+    def make_file_format_to_base_value_blocks(self, data: Iterable[dict]) -> List[tuple]:
+        unit_strings = {}
+        blocks = []
+        names = units = rows = None
+
+        for obj in data:
+            plan, error, _ = self._get_header_plan(obj)
+            if error is not None:
+                raise ValueError(error)
+
+            obj_names, obj_units, values = [], [], []
+            for kind, name, key, unit in plan:
+                if kind == NO_UOM:
+                    obj_units.append(None)
+                    values.append(obj[key])
                 else:
-                    # Exclude keys containing UoM suffix
-                    if (len(key) > len(self.uom_suffix)):
-                        if (key[-len(self.uom_suffix):] != self.uom_suffix):
-                            temp_obj[key] = obj[key]
-                    else:
-                        temp_obj[key] = obj[key]
-
-            data_unitfied.append(temp_obj)
+                    if kind == UOM_IN_VALUE:
+                        unit = str(obj[unit])
+                    magnitude, base_units = self._to_base_magnitude(obj[key], unit)
+                    if base_units not in unit_strings:
+                        unit_strings[base_units] = str(base_units)
+                    obj_units.append(unit_strings[base_units])
+                    values.append(magnitude)
+                obj_names.append(name)
+
+            obj_names, obj_units = tuple(obj_names), tuple(obj_units)
+            if obj_names != names or obj_units != units:
+                names, units, rows = obj_names, obj_units, []
+                blocks.append((names, units, rows))
+            rows.append(tuple(values))
+
+        return blocks
+
+    # A method that makes blocks of plain values (see make_file_format_to_base_value_blocks) into data in “code format”. Each unit string is
+    # parsed once per block. The method outputs a list of dictionaries.
+    def make_base_value_blocks_to_code_format(self, blocks: List[tuple]) -> List[dict]:
+        Quantity = self.Quantity
+        data = []
+        for names, units, rows in blocks:
+            parsed_units = [None if unit is None else self._get_unit_conversion(unit)[0] for unit in units]
+            for values in rows:
+                data.append({name: value if unit is None else Quantity(value, unit) for name, unit, value in zip(names, parsed_units, values)})
+        return data
+
+    # A method that makes data in “file format” into “code format”, column by column. The method takes a list of dictionaries as input, containing
+    # the data that is to be converted. The values of each quantity column are grouped by their unit, and each group is converted to base units
+    # as one NumPy array, so a column with a single unit costs one unit parse and one vectorized multiply. The method outputs a dictionary that
+    # maps each column to a Pint quantity holding an array of magnitudes (NaN where a row lacks the column), or to a list of the raw values for
+    # columns without UoM information (None where a row lacks the column). Quantities are converted to target_units, if given (see
+    # make_file_format_to_code_format), with the same factor for each unit group; a column whose unit is kept gets the unit of its first value.
+    @instrumented
+    def make_file_format_to_code_format_columnar(self, data: List[dict], target_units: Union[str, dict] = None) -> dict:
+        n_rows = len(data)
+        column_order = {}
+        unit_groups = {}  # column -> {unit: ([row indices], [values])}
+        unitless_columns = {}  # column -> [values]
+
+        for i, obj in enumerate(data):
+            plan, error, _ = self._get_header_plan(obj)
+            if error is not None:
+                print(f"Error: {error}")
+                return False
+
+            for kind, column, key, unit in plan:
+                column_order[column] = None
+                if kind == NO_UOM:
+                    unitless_columns.setdefault(column, [None] * n_rows)[i] = obj[key]
+                    continue
+
+                if kind == UOM_IN_VALUE:
+                    unit = str(obj[unit])
+                indices, values = unit_groups.setdefault(column, {}).setdefault(unit, ([], []))
+                indices.append(i)
+                values.append(obj[key])
+
+        data_unitfied = {}
+        for column in column_order:
+            if column not in unit_groups:
+                data_unitfied[column] = unitless_columns[column]
+                continue
+
+            if column in unitless_columns:
+                raise ValueError(f"Column '{column}' mixes values with and without UoM information.")
+
+            magnitudes, column_units = self._convert_unit_groups(column, unit_groups[column], n_rows, target_units)
+            data_unitfied[column] = self.Quantity(magnitudes, column_units)
+
         return data_unitfied
+
+    # A method that converts the values of a quantity column, grouped by their unit string (a dictionary that maps each unit to a tuple of
+    # the row indices and the values with that unit), to base units or to target_units (see _resolve_column_target). Each unit group is
+    # converted in one go with the cached multiplier and offset of its unit. The method outputs a NumPy array of n_rows magnitudes (NaN for
+    # rows not in a group) and the unit of the column. Units of different dimensions raise a DimensionalityError.
+    def _convert_unit_groups(self, column: str, unit_groups: dict, n_rows: int, target_units: Union[str, dict] = None) -> tuple:
+        import numpy as np
+        import pint
+
+        magnitudes = np.full(n_rows, np.nan)
+        column_units = None
+        target = None if target_units is None or not unit_groups else self._resolve_column_target(column, target_units, next(iter(unit_groups)))
+        for unit, (indices, values) in unit_groups.items():
+            units, base_units, multiplier, offset = self._get_unit_conversion(unit, target)
+            if column_units is None:
+                column_units = base_units
+            elif base_units != column_units:
+                raise pint.errors.DimensionalityError(column_units, base_units)
+
+            values = np.asarray(values, dtype=float)
+            if multiplier is None:
+                quantities = self.Quantity(values, units)
+                magnitudes[indices] = (quantities.to_base_units() if target is None else quantities.to(base_units)).magnitude
+            else:
+                magnitudes[indices] = values * multiplier + offset
+        return magnitudes, column_units
+
+    # A method that makes a pandas DataFrame in “file format” (e.g. from pandas.read_csv) into a DataFrame in “code format”, column by column.
+    # Each quantity column, with its UoM in a suffix column or in its header, is converted to base units (or to target_units, see
+    # make_file_format_to_code_format) one unit group at a time, and becomes one float column (NaN where a value or its unit is missing). The
+    # unit of each quantity column is kept in df.attrs["units"] (a dictionary of unit strings), or, with pint_dtypes = True, in the dtype of
+    # the column as a pint-pandas PintArray (pint-pandas, an optional dependency, must then be installed). Many pandas operations (e.g.
+    # merge and concat) do not keep df.attrs, so the units are lost there unless pint_dtypes is used. Suffix columns are dropped and other
+    # columns kept as they are. A key with the separator more than ones raises a ValueError.
+    def make_file_format_dataframe_to_code_format(self, df, target_units: Union[str, dict] = None, pint_dtypes: bool = False):
+        import numpy as np
+        import pandas as pd
+
+        plan, error, _ = self._get_header_plan(list(df.columns))
+        if error is not None:
+            raise ValueError(error)
+
+        columns = {}
+        units = {}
+        for kind, name, key, unit in plan:
+            if kind == NO_UOM:
+                columns[name] = df[key]
+                continue
+
+            values = df[key].to_numpy(dtype=float, na_value=np.nan)
+            if kind == UOM_IN_KEY:
+                unit_groups = {unit: (slice(None), values)}
+            else:
+                unit_groups = {str(group_unit): (indices, values[indices]) for group_unit, indices in df.groupby(unit, sort=False).indices.items()}
+            magnitudes, column_units = self._convert_unit_groups(name, unit_groups, len(df), target_units)
+
+            if pint_dtypes:
+                import pint_pandas
+                columns[name] = pd.Series(pint_pandas.PintArray(magnitudes, dtype=column_units), index=df.index)
+            else:
+                columns[name] = pd.Series(magnitudes, index=df.index)
+                units[name] = None if column_units is None else str(column_units)
+
+        code_format = pd.DataFrame(columns, index=df.index)
+        code_format.attrs["units"] = units
+        return code_format
+
+    # A method that makes a pandas DataFrame in “code format” (see make_file_format_dataframe_to_code_format) into a DataFrame in “file format”,
+    # with the same options as make_code_format_to_file_format. The unit of each quantity column is taken from df.attrs["units"] or from its
+    # pint-pandas dtype, and formatted once for the whole column.
+    def make_code_format_dataframe_to_file_format(self, df, uom_in_key: bool = False, uom_abbreviated: bool = False):
+        import pandas as pd
+
+        columns = {}
+        for name in df.columns:
+            column_units, column = self._get_dataframe_column(df, name)
+            if column_units is None:
+                columns[name] = column
+                continue
+
+            unit_string = self._format_units(column_units, uom_abbreviated)
+            value_key, unit_key = self._get_file_format_keys(name, unit_string, uom_in_key)
+            columns[value_key] = column
+            if unit_key is not None:
+                columns[unit_key] = pd.Series(unit_string, index=df.index)
+        return pd.DataFrame(columns, index=df.index)
+
+    # A method that makes a pandas DataFrame in “code format” into columnar data (see make_file_format_to_code_format_columnar), e.g. for
+    # DataReaderWriter.create_npy_dataset: a Pint quantity of the magnitudes per quantity column, a NumPy array per numeric column and a list
+    # (None for missing values) per other column.
+    def make_code_format_dataframe_to_columnar(self, df) -> dict:
+        data = {}
+        for name in df.columns:
+            column_units, column = self._get_dataframe_column(df, name)
+            if column_units is not None:
+                data[name] = self.Quantity(column.to_numpy(dtype=float), column_units)
+            elif column.dtype.kind in "iuf":
+                data[name] = column.to_numpy()
+            else:
+                data[name] = column.astype(object).where(column.notna(), None).tolist()
+        return data
+
+    # Outputs the unit (parsed with the registry of the Unitfier, None for columns without UoM information) and the magnitudes of a column of a
+    # DataFrame in code format, from df.attrs["units"] or from a pint-pandas dtype
+    def _get_dataframe_column(self, df, name: str) -> tuple:
+        import pandas as pd
+
+        column = df[name]
+        if str(column.dtype).startswith("pint["):
+            return self._get_unit_conversion(str(column.pint.units))[0], pd.Series(column.pint.magnitude, index=df.index)
+        unit = df.attrs.get("units", {}).get(name)
+        if unit is not None:
+            return self._get_unit_conversion(unit)[0], column
+        return None, column
+
+    # A method that aggregates a quantity column. The method takes data in “file format” (a list of dictionaries) or columnar data (e.g. from
+    # make_file_format_to_code_format_columnar or DataReaderWriter.read_npy_dataset), the name of the quantity column, the aggregate function
+    # ("sum", "mean", "min", "max" or "count") and optionally the name of a column without UoM information to group by. File format data is made
+    # columnar first, so each unit group is converted to base units once and the reduction is vectorized with NumPy. Rows without a value are
+    # left out. The method outputs one quantity in base units (an int for "count"), or a dictionary with one per group.
+    @instrumented
+    def aggregate(self, data: Union[List[dict], dict], column: str, function: str = "sum", group_by: str = None):
+        import numpy as np
+
+        if function not in ("sum", "mean", "min", "max", "count"):
+            raise ValueError(f"Aggregate function '{function}' is not one of 'sum', 'mean', 'min', 'max' and 'count'.")
+
+        if not isinstance(data, dict):
+            data = self.make_file_format_to_code_format_columnar(data)
+            if data is False:
+                return False
+
+        quantities = data[column]
+        magnitudes = np.asarray(quantities.magnitude, dtype=float)
+        present = ~np.isnan(magnitudes)
+
+        if group_by is None:
+            codes = np.zeros(len(magnitudes), dtype=int)
+            groups = [None]
+        else:
+            group_codes = {}
+            codes = np.fromiter((group_codes.setdefault(key, len(group_codes)) for key in data[group_by]), dtype=int, count=len(magnitudes))
+            groups = list(group_codes)
+
+        codes, magnitudes = codes[present], magnitudes[present]
+        counts = np.bincount(codes, minlength=len(groups))
+        if function == "count":
+            results = [int(count) for count in counts]
+        else:
+            if function in ("sum", "mean"):
+                reduced = np.bincount(codes, weights=magnitudes, minlength=len(groups))
+                if function == "mean":
+                    with np.errstate(invalid="ignore", divide="ignore"):
+                        reduced = reduced / counts
+            else:
+                reduced = np.full(len(groups), np.inf if function == "min" else -np.inf)
+                (np.minimum if function == "min" else np.maximum).at(reduced, codes, magnitudes)
+                reduced[counts == 0] = np.nan
+            results = [self.Quantity(float(magnitude), quantities.units) for magnitude in reduced]
+
+        if group_by is None:
+            return results[0]
+        return dict(zip(groups, results))
@@ -0,0 +1,82 @@
+import asyncio
+import pickle
+import pint
+import pytest
+import sys
+from concurrent.futures import ProcessPoolExecutor
+sys.path.insert(0, '../unitfier/src')
+from async_data_reader_writer import AsyncDataReaderWriter
+from data_reader_writer import DataReaderWriter
+from unitfier import Unitfier
+
+class Tests:
+
+    def test_can_read_and_create_concurrently(self, tmp_path):
+        # Input mock data
+        database = str(tmp_path / "data.db")
+        input = [{"length": i, "length_uom": "cm", "string": "row" + str(i)} for i in range(10)]
+
+        # Test
+        async def run():
+            async with AsyncDataReaderWriter(max_io_workers=4) as drw:
+                await asyncio.gather(drw.create_json(input, tmp_path / "data.json"), drw.create_xml(input, tmp_path / "data.xml"),
+                                     *(drw.create_database_table(input, database=database, table=table) for table in ("a", "b", "c")))
+                return await asyncio.gather(drw.read_json(tmp_path / "data.json"), drw.read_database_table(database, "a"),
+                                            drw.read_database_table(database, "b"), drw.read(database + "::c"))
+
+        for output in asyncio.run(run()):
+            assert output == input
+
+    def test_can_run_pipeline(self, tmp_path):
+        # Input mock data (three sources of different formats)
+        database = str(tmp_path / "data.db")
+        input = [{"length": i, "length_uom": "cm", "string": "row" + str(i)} for i in range(10)]
+        drw = DataReaderWriter()
+        drw.create_csv(input, tmp_path / "input.csv")
+        drw.create_jsonl(input, tmp_path / "input.jsonl")
+        drw.create_database_table(input, database, "input")
+        drw.close()
+        sources = [str(tmp_path / "input.csv"), str(tmp_path / "input.jsonl"), database + "::input"]
+        targets = [str(tmp_path / "output.json"), str(tmp_path / "output.xml"), database + "::output"]
+
+        # Expected output
+        expected_output = [{"length_uom_m": i / 100, "string": "row" + str(i)} for i in range(10)]
+
+        # Test
+        async def run():
+            async with AsyncDataReaderWriter() as async_drw:
+                code_format = await async_drw.pipeline(sources)
+                written = await async_drw.pipeline(sources, targets, uom_in_key=True, uom_abbreviated=True)
+                return code_format, written
+
+        code_format, written = asyncio.run(run())
+        assert code_format[0] == code_format[2] == drw.unitfier.make_file_format_to_code_format(input)
+        assert written == targets
+        assert drw.read_json(targets[0]) == expected_output
+        assert drw.read_database_table(database, "output") == expected_output
+        drw.close()
+
+    def test_can_run_pipeline_in_process_executor(self, tmp_path):
+        # Input mock data
+        input = [{"length": i, "length_uom": "cm"} for i in range(10)]
+        drw = DataReaderWriter()
+        drw.create_jsonl(input, tmp_path / "input.jsonl")
+        drw.create_jsonl([{"length_uom_cm_uom_m": 1}], tmp_path / "faulty.jsonl")
+
+        # Test (the Unitfier is pickled with empty caches, and rebuilds them in the worker)
+        u = Unitfier()
+        u.make_file_format_to_code_format(input)
+        u2 = pickle.loads(pickle.dumps(u))
+        assert u2.cache_info()["units"]["currsize"] == 0
+        assert u2.make_file_format_to_code_format(input) == u.make_file_format_to_code_format(input)
+        with pytest.raises(TypeError):
+            pickle.dumps(Unitfier(unit_registry=pint.UnitRegistry()))
+
+        async def run(sources):
+            async with AsyncDataReaderWriter(conversion_executor=ProcessPoolExecutor(max_workers=2)) as async_drw:
+                return await async_drw.pipeline(sources, [str(tmp_path / "output.jsonl")], uom_in_key=True)
+
+        assert asyncio.run(run([str(tmp_path / "input.jsonl")])) == [str(tmp_path / "output.jsonl")]
+        assert drw.read_jsonl(tmp_path / "output.jsonl") == [{"length_uom_meter": i / 100} for i in range(10)]
+        with pytest.raises(ValueError):
+            asyncio.run(run([str(tmp_path / "faulty.jsonl")]))
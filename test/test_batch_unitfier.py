@@ -0,0 +1,88 @@
+import pytest
+import sys
+sys.path.insert(0, '../unitfier/src')
+from batch_unitfier import BatchUnitfier
+from data_reader_writer import DataReaderWriter
+from unitfier import Unitfier
+
+class Tests:
+
+    def test_can_unitfy_sources_in_parallel(self, tmp_path):
+        # Input mock data (the same data in every format)
+        input = [{
+            "name": "one", "weight": 1, "weight_uom": "kg", "length_uom_cm": 10
+        }, {
+            "name": "two", "weight": 500, "weight_uom": "g", "length_uom_cm": 20
+        }, {
+            "name": "three", "temperature_uom_degC": 20
+        }]
+        drw = DataReaderWriter()
+        drw.create_json(input, tmp_path / "input.json")
+        drw.create_jsonl(input, tmp_path / "input.jsonl")
+        drw.create_csv(input[:2], tmp_path / "input.csv")
+        drw.create_xml(input, tmp_path / "input.xml")
+        drw.create_database_table(input[:2], str(tmp_path / "input.db"), "input")
+        drw.close()
+
+        sources = [str(tmp_path / "input.json*"), str(tmp_path / "input.csv"), str(tmp_path / "input.xml"), str(tmp_path / "input.db") + "::input"]
+
+        # Expected output
+        u = Unitfier()
+        expected_output = {
+            str(tmp_path / "input.json"): u.make_file_format_to_code_format(input),
+            str(tmp_path / "input.jsonl"): u.make_file_format_to_code_format(input),
+            str(tmp_path / "input.csv"): u.make_file_format_to_code_format(input[:2]),
+            str(tmp_path / "input.xml"): u.make_file_format_to_code_format(input),
+            (str(tmp_path / "input.db"), "input"): u.make_file_format_to_code_format(input[:2]),
+        }
+
+        # Test
+        output = BatchUnitfier(processes=2).unitfy_sources(sources)
+        assert list(output) == list(expected_output)
+        assert output == expected_output
+
+        merged = BatchUnitfier(processes=1).unitfy_sources(sources[:2], merge=True)
+        assert merged == expected_output[str(tmp_path / "input.json")] * 2 + expected_output[str(tmp_path / "input.csv")]
+
+    def test_can_unitfy_file_sharded(self, tmp_path):
+        # Input mock data
+        input = [{
+            "index": i, "weight": i, "weight_uom": ["kg", "g", "lb"][i % 3], "length_uom_cm": i
+        } for i in range(200)]
+        drw = DataReaderWriter()
+        drw.create_csv(input, tmp_path / "input.csv")
+        drw.create_jsonl(input, tmp_path / "input.jsonl")
+
+        # Expected output
+        u = Unitfier()
+        expected_output = u.make_file_format_to_code_format(input)
+        expected_file_format = u.make_code_format_to_file_format(expected_output, True, True)
+
+        # Test
+        bu = BatchUnitfier(processes=3)
+        assert bu.unitfy_file_sharded(str(tmp_path / "input.csv"), shard_size=500) == expected_output
+        assert bu.unitfy_file_sharded(str(tmp_path / "input.jsonl"), shard_size=1000) == expected_output
+
+        parts = bu.unitfy_file_sharded(str(tmp_path / "input.csv"), shard_size=1000, output_folder=str(tmp_path / "parts"),
+                                       uom_in_key=True, uom_abbreviated=True)
+        assert len(parts) > 1
+        assert [obj for part in parts for obj in drw.read_jsonl(part)] == expected_file_format
+
+        output = str(tmp_path / "output.json")
+        assert bu.unitfy_file_sharded(str(tmp_path / "input.csv"), shard_size=1000, output=output, uom_in_key=True, uom_abbreviated=True) == output
+        assert drw.read_json(output) == expected_file_format
+
+        # Every shard of a csv file is read with the types of the first shard, so an integer column with blanks in later shards only stays
+        # integer
+        (tmp_path / "blanks.csv").write_text("index,count\n" + "".join(f"{i},{i if i < 100 else ''}\n" for i in range(200)))
+        output = bu.unitfy_file_sharded(str(tmp_path / "blanks.csv"), shard_size=500)
+        assert [obj["count"] for obj in output] == [i if i < 100 else None for i in range(200)]
+        assert all(type(obj["count"]) is int for obj in output[:100])
+
+        with pytest.raises(ValueError):
+            bu.unitfy_file_sharded(str(tmp_path / "output.json"))
+
+        # A key with the separator more than ones fails the shard with a ValueError
+        drw.create_jsonl([{"length_uom_cm_uom_m": 1}], tmp_path / "faulty.jsonl")
+        with pytest.raises(ValueError):
+            bu.unitfy_file_sharded(str(tmp_path / "faulty.jsonl"), output=str(tmp_path / "faulty.json"))
@@ -0,0 +1,370 @@
+import json
+import os
+import numpy as np
+import pint
+import pytest
+import sqlite3
+import sys
+sys.path.insert(0, '../unitfier/src')
+from data_reader_writer import DataReaderWriter
+from unitfier import Unitfier
+
+class Tests:
+
+    def test_can_iterate_csv(self, tmp_path):
+        # Input mock data
+        filename = tmp_path / "input.csv"
+        filename.write_text("name,weight,weight_uom,note\none,1,kg,\ntwo,2.5,g,x\nthree,3,lb,y\n")
+
+        # Expected output
+        expected_output = [{
+            "name": "one", "weight": 1.0, "weight_uom": "kg", "note": None
+        }, {
+            "name": "two", "weight": 2.5, "weight_uom": "g", "note": "x"
+        }, {
+            "name": "three", "weight": 3.0, "weight_uom": "lb", "note": "y"
+        }]
+
+        # Test
+        drw = DataReaderWriter()
+        assert drw.read_csv(filename) == expected_output
+        assert list(drw.iter_csv(filename, chunksize=2)) == expected_output
+        assert list(drw.iter_csv(filename, chunksize=2, batched=True)) == [expected_output[:2], expected_output[2:]]
+
+        u = Unitfier()
+        output = list(u.iter_file_format_to_code_format(drw.iter_csv(filename, chunksize=1)))
+        assert output[2]["weight"] == pint.Quantity(3.0, "lb").to_base_units()
+        assert output[0]["note"] is None
+
+    def test_can_create_csv_with_keys_of_later_chunks(self, tmp_path):
+        # Input mock data (a key that first appears after the first chunk)
+        filename = tmp_path / "output.csv"
+        input = [{"a": i} for i in range(5)] + [{"a": 5, "b_uom_kg": 5}, {"a": 6}]
+
+        # Test
+        drw = DataReaderWriter()
+        drw.create_csv(iter(input), filename, chunksize=2)
+        assert filename.read_text() == "a,b_uom_kg\n0,\n1,\n2,\n3,\n4,\n5,5.0\n6,\n"
+        assert drw.read_csv(filename) == [{"a": i, "b_uom_kg": 5.0 if i == 5 else None} for i in range(7)]
+
+    def test_can_stream_xml(self, tmp_path):
+        # Input mock data (a generator of rows)
+        filename = tmp_path / "output.xml"
+        input = ({"index": i, "length_uom_m": i / 2} for i in range(3))
+
+        # Expected output
+        expected_output = [{"index": str(i), "length_uom_m": str(i / 2)} for i in range(3)]
+
+        # Test
+        drw = DataReaderWriter()
+        drw.create_xml(input, filename)
+        assert filename.read_bytes().startswith(b"<data><obj><index>0</index><length_uom_m>0.0</length_uom_m></obj>")
+        assert list(drw.iter_xml(filename)) == expected_output
+        assert drw.read_xml(filename) == expected_output
+
+        drw.create_xml([], filename)
+        assert filename.read_bytes() == b"<data />"
+        assert drw.read_xml(filename) == []
+
+    def test_can_stream_json_and_json_lines(self, tmp_path):
+        # Input mock data
+        input_filename = tmp_path / "input.json"
+        input_filename.write_text('{"meta": {"rows": 3}, "data": [{"length_uom_cm": 1}, {"length_uom_cm": 2.5e2}, {"length_uom_cm": 300}]}')
+        output_filename = tmp_path / "output.json"
+        output_lines_filename = tmp_path / "output.jsonl"
+
+        # Expected output
+        expected_output = [{"length_uom_m": 0.01}, {"length_uom_m": 2.5}, {"length_uom_m": 3.0}]
+
+        # Test
+        drw = DataReaderWriter()
+        u = Unitfier()
+        assert list(drw.iter_json(input_filename, buffer_size=4)) == drw.read_json(input_filename)
+
+        data = u.iter_code_format_to_file_format(u.iter_file_format_to_code_format(drw.iter_json(input_filename)), True, True)
+        drw.create_json(data, output_filename)
+        assert output_filename.read_text() == json.dumps({"data": expected_output}, indent=4)
+        assert drw.read_json(output_filename) == expected_output
+
+        drw.create_jsonl(drw.iter_json(output_filename), output_lines_filename)
+        assert output_lines_filename.read_text().count("\n") == 3
+        assert drw.read_jsonl(output_lines_filename) == expected_output
+        assert list(drw.iter_jsonl(output_lines_filename)) == expected_output
+
+    def test_can_create_and_read_typed_database_table(self, tmp_path):
+        # Input mock data
+        database = str(tmp_path / "data.db")
+        input = [{
+            "name": "one", "count": 1, "weight": 1, "weight_uom": "kg", "note": None
+        }, {
+            "name": "two", "count": 2, "weight": 2.5, "weight_uom": "g", "note": None
+        }, {
+            "name": "three", "count": 3, "weight": 3, "weight_uom": "lb"
+        }]
+
+        # Expected output
+        expected_output = [{
+            "name": "one", "count": 1, "weight": 1.0, "weight_uom": "kg", "note": None
+        }, {
+            "name": "two", "count": 2, "weight": 2.5, "weight_uom": "g", "note": None
+        }, {
+            "name": "three", "count": 3, "weight": 3.0, "weight_uom": "lb", "note": None
+        }]
+
+        # Test
+        drw = DataReaderWriter({"journal_mode": "WAL", "synchronous": "NORMAL"})
+        drw.create_database_table(iter(input), database, "measurements", batch_size=2)
+        assert drw.read_database_table(database, "measurements") == expected_output
+        assert list(drw.iter_database_table(database, "measurements", batch_size=2, batched=True)) == [expected_output[:2], expected_output[2:]]
+        assert drw._get_connection(database) is drw._get_connection(database)
+        assert drw._get_connection(database).execute("pragma journal_mode").fetchone() == ("wal",)
+        drw.close()
+
+        connection = sqlite3.connect(database)
+        assert connection.execute("select name, type from pragma_table_info('measurements')").fetchall() == [
+            ("name", "TEXT"), ("count", "INTEGER"), ("weight", "REAL"), ("weight_uom", "TEXT"), ("note", "TEXT")]
+        connection.close()
+
+        # A failing insert rolls back the whole transaction
+        with pytest.raises(sqlite3.Error):
+            drw.create_database_table([{"a": 1}, {"a": {}}], database, "failing", batch_size=1)
+        assert drw._get_connection(database).execute("select name from sqlite_master where name = 'failing'").fetchall() == []
+        drw.close()
+
+    def test_can_query_unit_normalized_database_table(self, tmp_path):
+        # Input mock data (mixed units)
+        database = str(tmp_path / "data.db")
+        input = [{
+            "Name": "Johansson", "Luggage_weight": 9, "Luggage_weight_uom": "kg"
+        }, {
+            "Name": "Berg", "Luggage_weight": 25000, "Luggage_weight_uom": "g"
+        }, {
+            "Name": "Lind", "Luggage_weight": 50, "Luggage_weight_uom": "lb"
+        }, {
+            "Name": "Ek", "Luggage_weight_uom_kg": 20
+        }]
+
+        # Test
+        drw = DataReaderWriter()
+        drw.create_database_table(input[:3], database, "luggage", unit_normalized=True)
+        drw.create_database_table(input[3:], database, "luggage_in_key", unit_normalized=True)
+        assert drw.read_database_table(database, "luggage") == input[:3]
+
+        heavy = drw.query_database_table(database, "luggage", [("Luggage_weight", ">", pint.Quantity(20, "kg"))])
+        assert [passenger["Name"] for passenger in heavy] == ["Berg", "Lind"]
+
+        between = drw.query_database_table(database, "luggage", [("Luggage_weight", ">=", pint.Quantity(9000, "g")),
+                                                                 ("Luggage_weight", "<", pint.Quantity(23, "kg"))])
+        assert [passenger["Name"] for passenger in between] == ["Johansson", "Lind"]
+
+        assert drw.query_database_table(database, "luggage_in_key", [("Luggage_weight", "=", pint.Quantity(20, "kg"))]) == input[3:]
+
+        query_plan = drw._get_connection(database).execute(
+            "explain query plan select * from luggage where Luggage_weight_base > 20").fetchall()
+        assert "idx_luggage_Luggage_weight_base" in str(query_plan)
+
+        with pytest.raises(pint.errors.DimensionalityError):
+            drw.query_database_table(database, "luggage", [("Luggage_weight", ">", pint.Quantity(20, "m"))])
+        with pytest.raises(ValueError):
+            drw.query_database_table(database, "luggage", [("Name", ">", pint.Quantity(20, "kg"))])
+        with pytest.raises(pint.errors.DimensionalityError):
+            drw.create_database_table([{"Luggage_weight": 1, "Luggage_weight_uom": "s"}], database, "luggage", unit_normalized=True)
+
+        # Later inserts and upserts keep the base columns up to date without unit_normalized
+        drw.create_database_table([{"Name": "Berg", "Luggage_weight": 1, "Luggage_weight_uom": "g"}], database, "luggage", mode="upsert", key="Name")
+        drw.create_database_table([{"Name": "Holm", "Luggage_weight": 30, "Luggage_weight_uom": "kg"}], database, "luggage", mode="append")
+        heavy = drw.query_database_table(database, "luggage", [("Luggage_weight", ">", pint.Quantity(20, "kg"))])
+        assert [passenger["Name"] for passenger in heavy] == ["Lind", "Holm"]
+        drw.close()
+
+    def test_can_create_and_read_npy_dataset(self, tmp_path):
+        # Input mock data
+        u = Unitfier()
+        input = u.make_file_format_to_code_format_columnar([{
+            "index": 0, "weight": 1, "weight_uom": "kg", "name": "one"
+        }, {
+            "index": 1, "weight": 500, "weight_uom": "g", "name": None
+        }])
+
+        # Test
+        drw = DataReaderWriter(unitfier=u)
+        drw.create_npy_dataset(input, tmp_path / "dataset")
+        output = drw.read_npy_dataset(tmp_path / "dataset")
+
+        assert list(output) == ["index", "weight", "name"]
+        assert isinstance(output["weight"].magnitude, np.memmap)
+        assert output["weight"].units == pint.Unit("kg")
+        assert list(output["weight"].magnitude) == [1.0, 0.5]
+        assert list(output["index"]) == [0, 1]
+        assert output["name"] == ["one", None]
+        assert not isinstance(drw.read_npy_dataset(tmp_path / "dataset", mmap=False)["weight"].magnitude, np.memmap)
+
+    def test_can_replace_npy_dataset(self, tmp_path):
+        # Input mock data (a wider dataset, memory-mapped, to write over)
+        folder = tmp_path / "dataset"
+        drw = DataReaderWriter()
+        Quantity = drw.unitfier.unit_registry.Quantity
+        drw.create_npy_dataset({"a": np.array([1.0, 2.0]), "b": ["x", "y"], "c": Quantity(np.array([3.0, 4.0]), "m")}, folder)
+        old = drw.read_npy_dataset(folder)
+
+        # Test (no column files are left behind, and arrays memory-mapped from the old dataset keep their values)
+        drw.create_npy_dataset({"a": np.array([5.0])}, folder)
+        assert sorted(os.listdir(folder)) == ["column_00000.npy", "manifest.json"]
+        assert drw.read_npy_dataset(folder)["a"].tolist() == [5.0]
+        assert old["a"].tolist() == [1.0, 2.0]
+        assert sorted(os.listdir(tmp_path)) == ["dataset"]
+
+        # A failing write leaves the dataset as it was, and a folder that holds no dataset is not replaced
+        with pytest.raises(TypeError):
+            drw.create_npy_dataset({"a": np.array([6.0]), "b": [object()]}, folder)
+        assert drw.read_npy_dataset(folder)["a"].tolist() == [5.0]
+        assert sorted(os.listdir(tmp_path)) == ["dataset"]
+        (tmp_path / "other").mkdir()
+        (tmp_path / "other" / "notes.txt").write_text("x")
+        with pytest.raises(ValueError):
+            drw.create_npy_dataset({"a": np.array([1.0])}, tmp_path / "other")
+
+    def test_can_read_and_create_dataframes(self, tmp_path):
+        # Input mock data
+        filename = tmp_path / "input.csv"
+        filename.write_text("name,weight,weight_uom,temp_uom_degC\none,1,kg,20\ntwo,2500,g,0\nthree,3,lb,-5\n")
+
+        # Test
+        drw = DataReaderWriter()
+        df = drw.read_csv_dataframe(filename)
+        assert df.attrs["units"] == {"weight": "kilogram", "temp": "kelvin"}
+        assert list(df.columns) == ["name", "weight", "temp"]
+        assert df["weight"].tolist() == pytest.approx([1.0, 2.5, 3 * 0.45359237])
+        assert df["temp"][1] == pytest.approx(273.15)
+
+        expected_output = drw.unitfier.make_code_format_to_file_format(drw.unitfier.make_file_format_to_code_format(drw.read_csv(filename)))
+        drw.create_from_dataframe(df, str(tmp_path / "output.json"))
+        assert drw.read_json(tmp_path / "output.json") == expected_output
+        drw.create_from_dataframe(df, str(tmp_path / "output.jsonl"), chunksize=2)
+        drw.create_from_dataframe(df, str(tmp_path / "output.jsonl"), mode="append")
+        assert drw.read_jsonl(tmp_path / "output.jsonl") == [pytest.approx(obj) for obj in expected_output] * 2
+
+        drw.create_from_dataframe(df, str(tmp_path / "output.csv"), uom_in_key=True, uom_abbreviated=True)
+        assert list(drw.read_csv_dataframe(tmp_path / "output.csv").columns) == ["name", "weight", "temp"]
+
+        database = str(tmp_path / "data.db")
+        drw.create_from_dataframe(df, database + "::data")
+        df_db = drw.read_database_table_dataframe(database, "data", target_units={"weight": "g"})
+        assert df_db.attrs["units"]["weight"] == "gram"
+        assert df_db["weight"].tolist() == pytest.approx([1000.0, 2500.0, 3000 * 0.45359237])
+        changed = df.iloc[:1].copy()
+        changed["weight"] = 4.0
+        drw.create_from_dataframe(changed, database + "::data", mode="upsert", key="name")
+        assert drw.read_database_table_dataframe(database, "data")["weight"].tolist() == pytest.approx([4.0, 2.5, 3 * 0.45359237])
+        drw.create_from_dataframe(df, database + "::copy", chunksize=2)
+        drw.create_from_dataframe(df, database + "::copy", mode="append")
+        assert [obj["name"] for obj in drw.read_database_table(database, "copy")] == ["one", "two", "three"] * 2
+
+        drw.create_from_dataframe(df, str(tmp_path / "dataset"))
+        dataset = drw.read_npy_dataset(tmp_path / "dataset")
+        assert dataset["weight"].m_as("kg") == pytest.approx([1.0, 2.5, 3 * 0.45359237])
+        assert dataset["name"] == ["one", "two", "three"]
+        drw.close()
+
+    def test_can_read_dataframes_with_pint_dtypes(self, tmp_path):
+        pytest.importorskip("pint_pandas")
+
+        # Input mock data
+        filename = tmp_path / "input.csv"
+        filename.write_text("name,weight,weight_uom,temp_uom_degC\none,1,kg,20\ntwo,2500,g,0\n")
+
+        # Test
+        drw = DataReaderWriter()
+        df = drw.read_csv_dataframe(filename, pint_dtypes=True)
+        assert [str(dtype) for dtype in df.dtypes] == ["object", "pint[kilogram]", "pint[kelvin]"]
+        assert df["weight"].pint.m_as("g").tolist() == pytest.approx([1000.0, 2500.0])
+
+        drw.create_from_dataframe(df, str(tmp_path / "output.json"))
+        assert drw.read_json(tmp_path / "output.json") == drw.unitfier.make_code_format_to_file_format(
+            drw.unitfier.make_file_format_to_code_format(drw.read_csv(filename)))
+        drw.create_from_dataframe(df, str(tmp_path / "dataset"))
+        assert drw.read_npy_dataset(tmp_path / "dataset")["temp"].m_as("K") == pytest.approx([293.15, 273.15])
+
+    @pytest.mark.parametrize("extension", ["csv", "json", "jsonl", "xml"])
+    def test_can_append_and_upsert_files(self, tmp_path, extension):
+        # Input mock data
+        input = [{"id": i, "weight": i * 1.5, "weight_uom": "kg"} for i in range(3)]
+        filename = tmp_path / ("output." + extension)
+
+        # Test (rows appended in place give the same file as rows written at once)
+        drw = DataReaderWriter()
+        create, read = getattr(drw, "create_" + extension), getattr(drw, "read_" + extension)
+        create(input, tmp_path / ("expected." + extension))
+        create(input[:1], filename, mode="append")
+        create([], filename, mode="append")
+        create(iter(input[1:]), filename, mode="append")
+        assert filename.read_bytes() == (tmp_path / ("expected." + extension)).read_bytes()
+
+        create([{"id": 1, "weight": 9.0, "weight_uom": "g"}, {"id": 7, "weight": 1.0, "weight_uom": "g"}], filename, mode="upsert", key="id")
+        output = [(str(obj["id"]), str(obj["weight"]), obj["weight_uom"]) for obj in read(filename)]
+        assert output == [("0", "0.0", "kg"), ("1", "9.0", "g"), ("2", "3.0", "kg"), ("7", "1.0", "g")]
+
+        # A row with some of the columns only updates those
+        create([{"id": 2, "weight": 4.5}], filename, mode="upsert", key="id")
+        assert [(str(obj["id"]), str(obj["weight"]), obj["weight_uom"]) for obj in read(filename)][2] == ("2", "4.5", "kg")
+
+        with pytest.raises(ValueError):
+            create(input, filename, mode="upsert")
+
+    def test_can_append_new_columns(self, tmp_path):
+        # Test (a csv file gets the new columns of appended rows)
+        drw = DataReaderWriter()
+        filename = tmp_path / "output.csv"
+        drw.create_csv([{"id": 0, "name": "zero"}], filename)
+        drw.create_csv([{"id": 1, "note": "a, b"}], filename, mode="append")
+        assert filename.read_text() == 'id,name,note\n0,zero,\n1,,"a, b"\n'
+        drw.create_csv([{"id": 2}, {"id": 3, "d": "new"}], filename, chunksize=1, mode="append")
+        assert filename.read_text() == 'id,name,note,d\n0,zero,,\n1,,"a, b",\n2,,,\n3,,,new\n'
+        drw.create_csv([{"id": 1, "e": "e"}, {"id": 4, "f": "f"}], filename, chunksize=2, mode="upsert", key="id")
+        assert filename.read_text() == 'id,name,note,d,e,f\n0,zero,,,,\n1,,"a, b",,e,\n2,,,,,\n3,,,new,,\n4,,,,,f\n'
+
+        # Test (a database table gets the new columns of each batch, and rows are merged into the rows with their key)
+        database = str(tmp_path / "data.db")
+        drw.create_database_table([{"id": 0, "weight": 1.0}, {"id": 1, "weight": 2.0}], database, "data")
+        drw.create_database_table([{"id": 1, "weight": 5.0}, {"id": 2, "note": "x"}, {"id": 0, "note": "y"}], database, "data", mode="upsert", key="id")
+        drw.create_database_table([{"id": 3, "count": 4}], database, "data", mode="append")
+        assert drw.read_database_table(database, "data") == [
+            {"id": 0, "weight": 1.0, "note": "y", "count": None},
+            {"id": 1, "weight": 5.0, "note": None, "count": None},
+            {"id": 2, "weight": None, "note": "x", "count": None},
+            {"id": 3, "weight": None, "note": None, "count": 4}]
+        connection = drw._get_connection(database)
+        assert connection.execute("select type from pragma_table_info('data') where name = 'count'").fetchone() == ("INTEGER",)
+
+        # Test (a dataset gets the appended rows, in the units of its columns)
+        folder = tmp_path / "dataset"
+        Quantity = drw.unitfier.unit_registry.Quantity
+        drw.create_npy_dataset({"weight": Quantity(np.array([1.0, 2.0]), "kg"), "name": ["a", "b"]}, folder)
+        drw.create_npy_dataset({"weight": Quantity(np.array([500.0]), "g"), "count": np.array([3])}, folder, mode="append")
+        dataset = drw.read_npy_dataset(folder)
+        assert dataset["weight"].m_as("kg").tolist() == [1.0, 2.0, 0.5]
+        assert dataset["name"] == ["a", "b", None]
+        assert dataset["count"] == [None, None, 3]
+        drw.close()
+
+    def test_can_read_sources_and_write_targets(self, tmp_path):
+        # Input mock data
+        input = [{"id": i, "weight": i * 1.5, "weight_uom": "kilogram"} for i in range(3)]
+
+        # Test (every target written with write_target reads back the same with iter_source)
+        drw = DataReaderWriter()
+        database = str(tmp_path / "data.db")
+        for target in ["output.csv", "output.json", "output.jsonl", "output.xml", "dataset"]:
+            drw.write_target(input, tmp_path / target)
+            output = [(str(obj["id"]), float(obj["weight"]), obj["weight_uom"]) for obj in drw.iter_source(tmp_path / target)]
+            assert output == [(str(obj["id"]), obj["weight"], obj["weight_uom"]) for obj in input]
+        drw.write_target(input, database + "::data")
+        drw.write_target([{"id": 1, "weight": 9.0, "weight_uom": "g"}], (database, "data"), mode="upsert", key="id")
+        assert list(drw.iter_source((database, "data")))[1] == {"id": 1, "weight": 9.0, "weight_uom": "g"}
+
+        assert drw.resolve_location(database + "::data") == ("database", (database, "data"))
+        with pytest.raises(ValueError):
+            drw.write_target(input, tmp_path / "output.txt")
+        with pytest.raises(ValueError):
+            drw.iter_source(tmp_path / "output.parquet")
+        drw.close()
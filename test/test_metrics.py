@@ -0,0 +1,72 @@
+import json
+import sys
+import time
+sys.path.insert(0, '../unitfier/src')
+from data_reader_writer import DataReaderWriter
+from metrics import Metrics
+from unitfier import Unitfier
+
+class Tests:
+
+    def test_can_record_metrics(self, tmp_path):
+        # Input mock data
+        filename = tmp_path / "output.json"
+        input = [{"length": i, "length_uom": "cm"} for i in range(5)]
+
+        # Test
+        hook_records = []
+        metrics = Metrics(hooks=[hook_records.append])
+        u = Unitfier(metrics=metrics)
+        drw = DataReaderWriter(unitfier=u, metrics=metrics)
+
+        drw.create_json((obj for obj in input), filename)
+        data = u.make_file_format_to_code_format(drw.read_json(filename))
+        output = list(u.iter_code_format_to_file_format(iter(data), True))
+
+        assert [record["stage"] for record in metrics.records] == [
+            "DataReaderWriter.create_json", "DataReaderWriter.read_json",
+            "Unitfier.make_file_format_to_code_format", "Unitfier.iter_code_format_to_file_format"]
+        assert hook_records == metrics.records
+        assert [record["rows"] for record in metrics.records] == [5, 5, 5, 5]
+        assert metrics.records[0]["bytes_written"] == filename.stat().st_size
+        assert metrics.records[1]["bytes_read"] == filename.stat().st_size
+        assert metrics.records[2]["unit_cache"]["hits"] == 4
+        assert len(output) == 5
+
+        # Calls made inside an instrumented call are not recorded twice
+        metrics.clear()
+        drw.create_xml(input, tmp_path / "output.xml")
+        drw.read_xml(tmp_path / "output.xml")
+        assert [record["stage"] for record in metrics.records] == ["DataReaderWriter.create_xml", "DataReaderWriter.read_xml"]
+
+        metrics.to_json(tmp_path / "metrics.json")
+        report = json.loads((tmp_path / "metrics.json").read_text())
+        assert report["summary"]["DataReaderWriter.read_xml"]["rows"] == 5
+
+        # Without metrics nothing is recorded
+        assert Unitfier().make_file_format_to_code_format(input) == data
+
+    def test_can_record_self_time_of_streaming_stages(self, tmp_path):
+        # Input mock data
+        filename = tmp_path / "input.jsonl"
+        filename.write_text("".join(json.dumps({"length": i, "length_uom": "cm"}) + "\n" for i in range(2000)))
+
+        # Test
+        metrics = Metrics()
+        u = Unitfier(metrics=metrics)
+        drw = DataReaderWriter(unitfier=u, metrics=metrics)
+
+        start = time.perf_counter()
+        data = u.iter_code_format_to_file_format(u.iter_file_format_to_code_format(drw.iter_jsonl(filename)))
+        drw.create_json(data, tmp_path / "output.json")
+        total = time.perf_counter() - start
+
+        summary = metrics.summary()
+        assert set(summary) == {"DataReaderWriter.iter_jsonl", "Unitfier.iter_file_format_to_code_format", "Unitfier.iter_code_format_to_file_format",
+            "DataReaderWriter.create_json"}
+        # The wall time of the writer includes the stages it pulls from, its self time does not, and the self times add up to the total
+        create = summary["DataReaderWriter.create_json"]
+        assert create["self_time_s"] < create["wall_time_s"]
+        assert all(0 <= stage["self_time_s"] <= stage["wall_time_s"] for stage in summary.values())
+        assert sum(stage["self_time_s"] for stage in summary.values()) <= total
+        assert sum(stage["wall_time_s"] for stage in summary.values()) > total
@@ -0,0 +1,57 @@
+import sys
+sys.path.insert(0, '../unitfier/src')
+from data_reader_writer import DataReaderWriter
+from schema_scanner import SchemaScanner
+
+class Tests:
+
+    def test_can_scan_data(self):
+        # Input mock data (a faulty key, a missing unit, an unknown unit and a unit of another dimension)
+        input = [
+            {"length_uom_m": 1, "weight": 1, "weight_uom": "kg", "name": "one"},
+            {"length_uom_m_uom_s": 1},
+            {"length_uom_cm": 2, "weight": 2, "weight_uom": None, "name": "two"},
+            {"length_uom_m": 1, "weight": 3, "weight_uom": "kgg", "name": "three"},
+            {"length_uom_m": 1, "weight": 4, "weight_uom": "s", "name": "four"},
+            {"length_uom_m": 1, "weight": 5, "weight_uom": "lb", "name": "five"},
+        ]
+
+        # Test
+        report = SchemaScanner().scan(input)
+        assert report["rows"] == 6 and report["complete"]
+        assert report["columns"]["length"] == {"kind": "uom_in_key", "keys": ["length_uom_m", "length_uom_cm"], "units": ["m", "cm"],
+                                               "dimensionality": "length", "converted_units": "meter"}
+        assert report["columns"]["weight"]["units"] == ["kg", "lb"]
+        assert report["columns"]["name"]["kind"] == "no_uom"
+        assert [(error["row"], error["column"], error["unit"]) for error in report["errors"]] == [
+            (1, None, None), (2, "weight", None), (3, "weight", "kgg"), (4, "weight", "s")]
+
+        report = SchemaScanner(max_errors=2).scan(input)
+        assert len(report["errors"]) == 2 and report["rows"] == 3 and not report["complete"]
+
+        report = SchemaScanner(target_units={"weight": "m"}).scan(input[:1])
+        assert report["errors"][0]["column"] == "weight"
+
+    def test_can_scan_sources(self, tmp_path):
+        # Input mock data
+        filename = tmp_path / "input.csv"
+        filename.write_text("name,weight,weight_uom,length_uom_mm\n" + "".join(f"row{i},{i},{'lb' if i == 7 else 'kg'},{i}\n" for i in range(10)))
+
+        # Test
+        scanner = SchemaScanner(target_units="imperial")
+        report = scanner.scan_source(str(filename), chunksize=4)
+        assert report["rows"] == 10 and report["errors"] == []
+        assert report["columns"]["weight"]["units"] == ["kg", "lb"]
+        assert report["columns"]["length"]["converted_units"] == "yard"
+
+        drw = DataReaderWriter()
+        database = str(tmp_path / "data.db")
+        rows = drw.read_csv(filename)
+        rows[5]["weight_uom"] = "furlong"
+        drw.create_database_table(rows, database, "data")
+        drw.close()
+        report = scanner.scan_source(database + "::data")
+        assert report["rows"] == 10
+        assert [(error["row"], error["unit"]) for error in report["errors"]] == [(5, "furlong")]
+
+        assert SchemaScanner().scan_source(str(filename)) == SchemaScanner().scan(DataReaderWriter().iter_csv(filename))
@@ -0,0 +1,60 @@
+import sys
+import pytest
+sys.path.insert(0, '../unitfier/src')
+from data_reader_writer import DataReaderWriter
+from transcoder import Transcoder
+from unitfier import Unitfier
+
+class Tests:
+
+    def test_can_transcode_data(self):
+        # Input mock data (suffix columns, offset unit and a missing value)
+        input = [{
+            "length": 150,
+            "length_uom": "cm",
+            "temperature": 32,
+            "temperature_uom": "degF",
+            "string": "one"
+        }, {
+            "length": None,
+            "length_uom": "cm",
+            "temperature": "212",
+            "temperature_uom": "degF",
+            "string": "two"
+        }]
+
+        # Test
+        u = Unitfier()
+        t = Transcoder(u, Unitfier(" unit", " (", ")"))
+        assert list(t.iter_transcode(input, True, True)) == [{
+            "length (cm)": 150,
+            "temperature (°F)": 32,
+            "string": "one"
+        }, {
+            "length (cm)": None,
+            "temperature (°F)": 212.0,
+            "string": "two"
+        }]
+
+        output = list(Transcoder(u).iter_transcode(input[:1], base_units=True))
+        assert output == u.make_code_format_to_file_format(u.make_file_format_to_code_format(input[:1]))
+        assert u.cache_info()["units"]["misses"] == 2
+
+        with pytest.raises(ValueError):
+            list(t.iter_transcode([{"time_uom_s_uom_s": 1}]))
+
+    def test_can_transcode_files(self, tmp_path):
+        # Input mock data
+        input = [{"length": i, "length_uom": "cm", "string": "row" + str(i)} for i in range(3)]
+        drw = DataReaderWriter()
+        drw.create_csv(input, tmp_path / "input.csv")
+
+        # Test
+        t = Transcoder()
+        t.transcode(str(tmp_path / "input.csv"), str(tmp_path / "output.jsonl"), True, True, True)
+        assert drw.read_jsonl(tmp_path / "output.jsonl") == [{"length_uom_m": i / 100, "string": "row" + str(i)} for i in range(3)]
+
+        database = str(tmp_path / "data.db")
+        t.transcode(str(tmp_path / "output.jsonl"), database + "::data")
+        assert drw.read_database_table(database, "data") == [{"length": i / 100, "length_uom": "meter", "string": "row" + str(i)} for i in range(3)]
+        drw.close()
@@ -0,0 +1,80 @@
+import pint
+import sys
+import pytest
+sys.path.insert(0, '../unitfier/src')
+from data_reader_writer import DataReaderWriter
+from unit_table import UnitTable
+from unitfier import Unitfier
+
+class Tests:
+
+    def test_can_make_unit_table(self):
+        # Input mock data (mixed units in one column and a missing value)
+        input = [{
+            "length": 1,
+            "length_uom": "cm",
+            "weight_uom_g": 500,
+            "string": "one"
+        }, {
+            "length": 2,
+            "length_uom": "m",
+            "string": "two"
+        }]
+
+        # Test
+        u = Unitfier()
+        table = u.make_file_format_to_unit_table(iter(input))
+        assert len(table) == 2
+        assert table.names == ["length", "weight", "string"]
+        assert list(table.columns[0]) == [0.01, 2.0]
+
+        row = table[1]
+        assert list(row) == ["length", "string"]
+        assert row["length"] == pint.Quantity(2.0, "m")
+        assert "weight" not in row
+        with pytest.raises(KeyError):
+            row["weight"]
+
+        code_format = u.make_file_format_to_code_format(input)
+        assert table.to_dicts() == code_format
+        assert UnitTable.from_dicts(code_format).to_dicts() == code_format
+        assert u.make_code_format_to_file_format(table, True, True) == u.make_code_format_to_file_format(code_format, True, True)
+        assert list(table.column("weight").magnitude[:1]) == [0.5]
+
+        with pytest.raises(ValueError):
+            u.make_file_format_to_unit_table([{"a_uom_kg": 1}, {"a": 1}])
+        with pytest.raises(pint.errors.DimensionalityError):
+            u.make_file_format_to_unit_table([{"a_uom_kg": 1}, {"a_uom_s": 1}])
+
+    def test_can_store_missing_values_compactly(self):
+        # Input mock data (columns that first appear late, and a None value that is not missing)
+        rows = 100000
+        input = [{"index": i} for i in range(rows)] + [{"index": rows, "note": None, "weight_uom_kg": 1}]
+
+        # Test
+        table = Unitfier().make_file_format_to_unit_table(input)
+        note, weight = table.names.index("note"), table.names.index("weight")
+        assert isinstance(table.missing[note], bytearray) and sys.getsizeof(table.missing[note]) < 2 * rows
+        assert table.missing[weight] is None
+        assert dict(table[rows]) == {"index": rows, "note": None, "weight": pint.Quantity(1.0, "kg")}
+        assert dict(table[0]) == {"index": 0}
+        assert table.column("note")[-2:] == [None, None]
+
+    def test_can_write_unit_table(self, tmp_path):
+        # Input mock data
+        input = [{"length": i, "length_uom": "cm", "string": str(i)} for i in range(3)]
+
+        # Test
+        drw = DataReaderWriter()
+        table = drw.unitfier.make_file_format_to_unit_table(input)
+        expected_output = drw.unitfier.make_code_format_to_file_format(drw.unitfier.make_file_format_to_code_format(input))
+
+        drw.create_jsonl(table, tmp_path / "output.jsonl")
+        assert drw.read_jsonl(tmp_path / "output.jsonl") == expected_output
+
+        drw.create_database_table(table, str(tmp_path / "data.db"), "data")
+        assert drw.read_database_table(str(tmp_path / "data.db"), "data") == expected_output
+        drw.close()
+
+        drw.create_npy_dataset(table, tmp_path / "dataset")
+        assert list(drw.read_npy_dataset(tmp_path / "dataset")["length"].magnitude) == [0.0, 0.01, 0.02]
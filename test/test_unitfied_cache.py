@@ -0,0 +1,80 @@
+import os
+import pint
+import sys
+sys.path.insert(0, '../unitfier/src')
+from data_reader_writer import DataReaderWriter
+from unitfied_cache import UnitfiedCache
+
+class Tests:
+
+    def test_can_cache_unitfied_data(self, tmp_path):
+        # Input mock data
+        filename = str(tmp_path / "input.jsonl")
+        input = [{"length": i, "length_uom": "cm", "string": "row" + str(i)} for i in range(3)]
+        drw = DataReaderWriter()
+        drw.create_jsonl(input, filename)
+
+        # Test
+        cache = UnitfiedCache(str(tmp_path / "cache"), reader_writer=drw)
+        output = cache.read(filename)
+        assert list(output["length"].magnitude) == [0.0, 0.01, 0.02]
+        assert output["string"] == ["row0", "row1", "row2"]
+        assert cache.read_rows(filename) == drw.unitfier.make_file_format_to_code_format(input)
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        # A changed source is read again and replaces its old entry
+        drw.create_jsonl(input[:2], filename)
+        os.utime(filename, ns=(0, 0))
+        assert len(cache.read_rows(filename)) == 2
+        assert cache.info()["entries"] == 1
+        assert cache.misses == 2
+
+        cache.invalidate(filename)
+        assert cache.info()["entries"] == 0
+
+    def test_can_evict_and_key_cached_data(self, tmp_path):
+        # Input mock data
+        database = str(tmp_path / "data.db")
+        drw = DataReaderWriter()
+        for table in ("a", "b", "c"):
+            drw.create_database_table([{"weight": i, "weight_uom": "g"} for i in range(100)], database, table)
+        drw.close()
+
+        # Test
+        cache = UnitfiedCache(str(tmp_path / "cache"), fingerprint="hash", target_units={"weight": None}, reader_writer=drw)
+        assert cache.read(database + "::a")["weight"].units == pint.Unit("g")
+        size = cache.info()["bytes"]
+        cache.read((database, "b"))
+        assert cache.info()["entries"] == 2
+
+        # Storing a third entry evicts the least recently used one (b)
+        cache.max_bytes = 2 * size
+        cache.read(database + "::a")
+        cache.read(database + "::c")
+        assert cache.info()["entries"] == 2
+        assert (cache.hits, cache.misses) == (1, 3)
+        cache.read(database + "::a")
+        cache.read(database + "::b")
+        assert (cache.hits, cache.misses) == (2, 4)
+
+        cache.invalidate()
+        assert cache.info()["bytes"] == 0
+        drw.close()
+
+    def test_can_cache_database_in_wal_mode(self, tmp_path):
+        # Input mock data (a database whose writes stay in its -wal file)
+        database = str(tmp_path / "data.db")
+        drw = DataReaderWriter({"journal_mode": "WAL"})
+        drw.create_database_table([{"weight": 1, "weight_uom": "kg"}], database, "data")
+
+        # Test
+        for fingerprint in ("stat", "hash"):
+            cache = UnitfiedCache(str(tmp_path / ("cache_" + fingerprint)), fingerprint=fingerprint)
+            drw.create_database_table([{"weight": 2, "weight_uom": "g"}], database, "data")
+            rows = len(drw.read_database_table(database, "data"))
+            assert len(cache.read(database + "::data")["weight"]) == rows
+            drw.create_database_table([{"weight": 3, "weight_uom": "lb"}], database, "data")
+            assert os.path.getsize(database + "-wal") > 0
+            assert len(cache.read(database + "::data")["weight"]) == rows + 1
+            assert cache.info()["misses"] == 2
+        drw.close()
@@ -1,3 +1,4 @@
+import numpy as np
 import pint
 import sys
 import pytest
@@ -85,6 +86,247 @@ class Tests:
              u.make_file_format_to_code_format(input3)
 
 
+    def test_can_unitfy_data_streaming(self):
+        # Input mock data (a generator of rows)
+        input = ({
+            "length": i,
+            "length_uom": "cm",
+            "string": str(i)
+        } for i in range(3))
+
+        # Expected output
+        expected_output = [{
+            "length": pint.Quantity(i / 100, "m"),
+            "string": str(i)
+        } for i in range(3)]
+
+        # Test
+        u = Unitfier()
+        output = u.iter_file_format_to_code_format(input)
+        assert next(output) == expected_output[0]
+        assert list(output) == expected_output[1:]
+
+        with pytest.raises(ValueError):
+            list(u.iter_file_format_to_code_format([{"time_uom_s_uom_s": 1}]))
+
+    def test_can_unitfy_data_lazily(self):
+        # Input mock data (a wide row of which one quantity is used)
+        input = [{
+            "length": 1,
+            "length_uom": "cm",
+            "weight_uom_g": 500,
+            "string": "one"
+        }]
+
+        # Test
+        u = Unitfier()
+        output = u.make_file_format_to_code_format(input, lazy=True)
+        row = output[0]
+        assert list(row) == ["length", "weight", "string"]
+        assert u.cache_info()["units"]["currsize"] == 0
+
+        assert row["weight"] == pint.Quantity(0.5, "kg")
+        assert row["weight"] is row["weight"]
+        assert u.cache_info()["units"]["currsize"] == 1
+
+        assert row == u.make_file_format_to_code_format(input)[0]
+        assert u.make_code_format_to_file_format(output) == u.make_code_format_to_file_format(u.make_file_format_to_code_format(input))
+
+        row["extra"] = 1
+        del row["string"]
+        assert list(row) == ["length", "weight", "extra"]
+        with pytest.raises(KeyError):
+            row["string"]
+
+        assert next(u.iter_file_format_to_code_format(input, lazy=True))["length"] == pint.Quantity(0.01, "m")
+
+    def test_can_unitfy_data_columnar(self):
+        # Input mock data (mixed units in one column, missing values and faulty key)
+        input = [{
+            "weight": 1,
+            "weight_uom": "kg",
+            "length_uom_cm": 1,
+            "string": "one"
+        }, {
+            "weight": 500,
+            "weight_uom": "g",
+            "string": "two"
+        }, {
+            "weight_uom_lb": 1,
+            "length_uom_m": 2,
+        }]
+        input2 = [{
+            "time_uom_s_uom_s": 1,
+        }]
+
+        # Test
+        u = Unitfier()
+        output = u.make_file_format_to_code_format_columnar(input)
+
+        assert list(output) == ["weight", "length", "string"]
+        assert output["weight"].units == pint.Unit("kg")
+        assert list(output["weight"].magnitude) == [1.0, 0.5, pint.Quantity(1.0, "lb").to_base_units().magnitude]
+        assert output["length"].units == pint.Unit("m")
+        assert output["length"].magnitude[0] == 0.01
+        assert np.isnan(output["length"].magnitude[1])
+        assert output["length"].magnitude[2] == 2.0
+        assert output["string"] == ["one", "two", None]
+
+        assert u.make_file_format_to_code_format_columnar(input2) == False
+
+        with pytest.raises(pint.errors.DimensionalityError):
+            u.make_file_format_to_code_format_columnar([{"a_uom_kg": 1}, {"a_uom_s": 1}])
+
+    def test_can_convert_to_target_units(self):
+        # Input mock data (mixed units in one column)
+        input = [{
+            "weight": 12000,
+            "weight_uom": "g",
+            "speed_uom_km/hour": 36,
+            "length_uom_cm": 1,
+        }, {
+            "weight": 1,
+            "weight_uom": "kg",
+            "speed_uom_km/hour": 72,
+            "length_uom_cm": 2,
+        }]
+        target_units = {"weight": None, "speed": "km/hour"}
+
+        # Test
+        u = Unitfier()
+        output = u.make_file_format_to_code_format(input, target_units=target_units)
+        assert output[0] == {"weight": pint.Quantity(12000, "g"), "speed": pint.Quantity(36, "km/hour"), "length": pint.Quantity(0.01, "m")}
+        assert str(output[0]["weight"].units) == "gram"
+        assert str(output[1]["weight"].units) == "kilogram"
+        assert u.make_file_format_to_code_format(input, lazy=True, target_units=target_units) == output
+        assert u.make_file_format_to_code_format(u.make_code_format_to_file_format(output), target_units=target_units) == output
+
+        columnar = u.make_file_format_to_code_format_columnar(input, target_units)
+        assert columnar["weight"].units == pint.Unit("g")
+        assert list(columnar["weight"].magnitude) == [12000.0, 1000.0]
+        assert list(columnar["speed"].magnitude) == [36.0, 72.0]
+        assert u.make_file_format_to_unit_table(input, target_units).to_dicts() == output
+
+        imperial = u.make_file_format_to_code_format(input[:1], target_units="imperial")[0]
+        assert imperial["speed"].units == pint.Unit("yard / second")
+        assert imperial["speed"].m_as("km/hour") == pytest.approx(36)
+
+        with pytest.raises(pint.errors.DimensionalityError):
+            u.make_file_format_to_code_format(input, target_units={"speed": "kg"})
+
+    def test_can_reuse_header_plans(self):
+        # Input mock data (three rows sharing one key set)
+        input = [{
+            "time": i,
+            "time_uom": "s",
+            "length_uom_m": i,
+        } for i in range(3)]
+
+        # Test
+        u = Unitfier(header_plan_cache_size=1)
+        u.make_file_format_to_code_format(input)
+        assert u.cache_info()["header_plans"] == {"hits": 2, "misses": 1, "maxsize": 1, "currsize": 1}
+
+        u.make_file_format_to_code_format([{"other": 1}] + input)
+        assert u.cache_info()["header_plans"]["misses"] == 3
+        assert u.cache_info()["header_plans"]["currsize"] == 1
+
+        u2 = Unitfier(" unit", " (", ")")
+        code_format = u2.make_file_format_to_code_format([{"length (cm)": 1}])
+        file_format = u2.make_code_format_to_file_format(code_format, True, True)
+        assert file_format == [{"length (m)": 0.01}]
+        assert u2.make_file_format_to_code_format(file_format) == code_format
+
+    def test_can_cache_unit_conversions(self):
+        # Input mock data (a handful of units repeated over many rows, offset and logarithmic units)
+        input = [{
+            "weight": i,
+            "weight_uom": ["kg", "g", "lb"][i % 3],
+            "temperature_uom_degF": i,
+            "level_uom_dB": i,
+        } for i in range(30)]
+
+        # Expected output
+        expected_output = [{
+            "weight": pint.Quantity(float(i), ["kg", "g", "lb"][i % 3]).to_base_units(),
+            "temperature": pint.Quantity(float(i), "degF").to_base_units(),
+            "level": pint.Quantity(float(i), "dB").to_base_units(),
+        } for i in range(30)]
+
+        # Test
+        u = Unitfier(unit_cache_size=2)
+        assert u.make_file_format_to_code_format(input) == expected_output
+        assert u.cache_info()["units"]["currsize"] == 2
+        assert u.cache_info()["units"]["misses"] > 5
+
+        u2 = Unitfier()
+        assert u2.make_file_format_to_code_format(input) == expected_output
+        assert u2.cache_info()["units"] == {"hits": 85, "misses": 5, "maxsize": 256, "currsize": 5}
+
+    def test_can_use_shared_unit_registry(self, tmp_path):
+        # Input mock data
+        input = [{
+            "length_uom_cm": 1,
+        }]
+
+        # Test
+        u = Unitfier(unit_registry_cache_folder=str(tmp_path))
+        u2 = Unitfier(unit_registry_cache_folder=str(tmp_path))
+        assert u.unit_registry is u2.unit_registry
+        assert u.unit_registry is not pint.get_application_registry()
+
+        output = u.make_file_format_to_code_format(input)
+        assert output[0]["length"]._REGISTRY is u.unit_registry
+        assert output == [{"length": pint.Quantity(0.01, "m")}]
+        assert u.make_code_format_to_file_format(output, True, True) == [{"length_uom_m": 0.01}]
+
+        ureg = pint.UnitRegistry()
+        u3 = Unitfier(unit_registry=ureg)
+        assert u3.make_file_format_to_code_format(input)[0]["length"]._REGISTRY is ureg
+        assert Unitfier().unit_registry is pint.get_application_registry()
+
+        # Without a configured registry, quantities are made with pint.Quantity itself
+        u4 = Unitfier()
+        assert type(u4.make_file_format_to_code_format(input)[0]["length"]) == pint.Quantity
+        assert type(u4.make_file_format_to_code_format_columnar(input)["length"]) == pint.Quantity
+        assert type(u4.make_file_format_to_unit_table(input)[0]["length"]) == pint.Quantity
+        assert type(u4.make_file_format_to_code_format(input, lazy=True)[0]["length"]) == pint.Quantity
+
+    def test_can_aggregate_quantities(self):
+        # Input mock data (mixed units in one column, a missing value)
+        input = [{
+            "Name": "Johansson", "Flight": "A", "Luggage_weight": 9, "Luggage_weight_uom": "kg"
+        }, {
+            "Name": "Berg", "Flight": "A", "Luggage_weight": 12000, "Luggage_weight_uom": "g"
+        }, {
+            "Name": "Lind", "Flight": "B", "Luggage_weight": 20, "Luggage_weight_uom": "lb"
+        }, {
+            "Name": "Ek", "Flight": "B", "Luggage_weight_uom_kg": 1
+        }, {
+            "Name": "Al", "Flight": "C"
+        }]
+        lb = pint.Quantity(20, "lb").to_base_units().magnitude
+
+        # Test
+        u = Unitfier()
+        assert u.aggregate(input, "Luggage_weight") == pint.Quantity(22.0 + lb, "kg")
+        assert u.aggregate(input, "Luggage_weight", "count") == 4
+        assert u.aggregate(input, "Luggage_weight", "min") == pint.Quantity(1.0, "kg")
+        assert u.aggregate(input, "Luggage_weight", "max") == pint.Quantity(12.0, "kg")
+
+        by_flight = u.aggregate(input, "Luggage_weight", "mean", group_by="Flight")
+        assert list(by_flight) == ["A", "B", "C"]
+        assert by_flight["A"] == pint.Quantity(10.5, "kg")
+        assert by_flight["B"] == pint.Quantity((lb + 1.0) / 2, "kg")
+        assert np.isnan(by_flight["C"].magnitude)
+        assert u.aggregate(input, "Luggage_weight", "count", group_by="Flight") == {"A": 2, "B": 2, "C": 0}
+
+        columnar = u.make_file_format_to_code_format_columnar(input)
+        assert u.aggregate(columnar, "Luggage_weight", "max", group_by="Flight")["B"] == pint.Quantity(lb, "kg")
+
+        with pytest.raises(ValueError):
+            u.aggregate(input, "Luggage_weight", "median")
+
     def test_can_add_uom_suffix_and_separator(self):
         # Input mock data
         input = [{
@@ -161,6 +403,29 @@ class Tests:
         assert u.make_code_format_to_file_format(input) == expected_output
         assert u.make_code_format_to_file_format(input, True, True) == expected_output_abbreviated
 
+    def test_can_make_columnar_data_to_file_format(self):
+        # Input mock data (many rows with one unit per column and a missing value)
+        input = [{
+            "speed": i,
+            "speed_uom": "km/hour",
+            "string": str(i)
+        } for i in range(100)]
+        input[1] = {"string": "1"}
+
+        # Test
+        u = Unitfier()
+        expected_output = u.make_code_format_to_file_format(u.make_file_format_to_code_format(input), True, True)
+        assert u.cache_info()["unit_strings"]["misses"] == 1
+        assert u.cache_info()["unit_strings"]["hits"] == 98
+
+        columnar = u.make_file_format_to_code_format_columnar(input)
+        assert u.make_code_format_columnar_to_file_format(columnar, True, True) == expected_output
+        assert u.make_code_format_columnar_to_file_format(u.make_file_format_to_unit_table(input).to_columnar(), True, True) == expected_output
+        assert u.cache_info()["unit_strings"]["misses"] == 1
+
+        u.make_pint_quantities_to_file_format([pint.Quantity(1, "m/s")] * 3)
+        assert u.cache_info()["dimensionality_strings"] == {"hits": 2, "misses": 1, "maxsize": 256, "currsize": 1}
+
     def test_can_make_pint_quantities_to_file_format(self):
         # Input mock data
         input = [